@@ -0,0 +1,564 @@
+import random
+import sys
+import time
+import tracemalloc
+
+import legacy
+
+#######################################
+# HELPERS
+#######################################
+
+def make_formula(n_terms, seed=0):
+    rng = random.Random(seed)
+    parts = [str(rng.randint(1, 999))]
+
+    for _ in range(n_terms - 1):
+        parts.append(rng.choice('+-*/'))
+        if rng.random() < 0.3:
+            parts.append(f'({rng.randint(1, 99)}.{rng.randint(0, 99)} - -{rng.randint(1, 9)})')
+        else:
+            parts.append(str(rng.randint(1, 999)))
+
+    return ' '.join(parts)
+
+def best_of(func, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best: best = elapsed
+    return best
+
+def allocated_by(func):
+    tracemalloc.start()
+    try:
+        result = func()
+        size, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, size, peak
+
+#######################################
+# BENCHMARKS
+#######################################
+
+def bench_lexer(n_terms=20000):
+    text = make_formula(n_terms)
+    n_tokens = len(legacy.Lexer('<bench>', text).scan_tokens()[0])
+
+    print(f'lexer: {len(text)} chars, {n_tokens} tokens')
+    for name in ('make_tokens', 'scan_tokens'):
+        elapsed = best_of(lambda: getattr(legacy.Lexer('<bench>', text), name)())
+        print(f'  {name:<12} {n_tokens / elapsed:>12,.0f} tokens/s')
+
+def bench_memory(n_terms=20000):
+    text = make_formula(n_terms)
+    lexer = legacy.Lexer('<bench>', text)
+
+    tokens, size, _ = allocated_by(lambda: lexer.scan_tokens()[0])
+    print(f'memory: {len(tokens)} tokens')
+    print(f'  tokens       {size / len(tokens):>8.1f} bytes/token')
+
+    _, size, _ = allocated_by(lambda: legacy.Parser(tokens, lexer.source).parse().node)
+    print(f'  ast          {size / len(tokens):>8.1f} bytes/token')
+
+    buffer, size, _ = allocated_by(lambda: lexer.buffer_tokens()[0])
+    print(f'  buffer       {size / len(tokens):>8.1f} bytes/token')
+
+    # Whole lex + parse: token list up front, streamed, or buffered
+    def parse_list():
+        lexer = legacy.Lexer('<bench>', text)
+        return legacy.Parser(lexer.scan_tokens()[0], lexer.source).parse().node
+
+    def parse_stream():
+        lexer = legacy.Lexer('<bench>', text)
+        return legacy.Parser(lexer.iter_tokens(), lexer.source).parse().node
+
+    def parse_buffer():
+        lexer = legacy.Lexer('<bench>', text)
+        return legacy.BufferParser(lexer.buffer_tokens()[0], lexer.source).parse().node
+
+    for name, func in (('list', parse_list), ('stream', parse_stream), ('buffer', parse_buffer)):
+        _, size, peak = allocated_by(func)
+        print(f'  {name:<12} {peak / len(tokens):>8.1f} bytes/token peak, {size / len(tokens):.1f} retained by the ast')
+
+def bench_parser(n_terms=20000, depth=50000):
+    text = make_formula(n_terms)
+    lexer = legacy.Lexer('<bench>', text)
+    tokens = lexer.scan_tokens()[0]
+
+    print(f'parser: {len(tokens)} tokens')
+    for parser_class in (legacy.Parser, legacy.DirectParser, legacy.IterativeParser):
+        elapsed = best_of(lambda: parser_class(tokens, lexer.source).parse())
+        print(f'  {parser_class.__name__:<16} {len(tokens) / elapsed:>12,.0f} tokens/s')
+
+    # Only the iterative parser survives this without a RecursionError
+    text = '(' * depth + '1' + ')' * depth
+    lexer = legacy.Lexer('<bench>', text)
+    tokens = lexer.scan_tokens()[0]
+    elapsed = best_of(lambda: legacy.IterativeParser(tokens, lexer.source).parse())
+    print(f'  nested x{depth:<10} {len(tokens) / elapsed:>12,.0f} tokens/s')
+
+def bench_cache(n_formulas=200, n_runs=20000):
+    formulas = [make_formula(20, seed) for seed in range(n_formulas)]
+    rng = random.Random(0)
+    workload = [rng.choice(formulas) for _ in range(n_runs)]
+
+    def run_all():
+        for text in workload: legacy.run('<bench>', text)
+
+    print(f'cache: {n_runs} runs over {n_formulas} distinct formulas')
+    for maxsize in (0, 1024):
+        legacy.parse_cache.clear()
+        legacy.parse_cache.maxsize = maxsize
+        elapsed = best_of(run_all, repeat=3)
+        print(f'  maxsize={maxsize:<6} {n_runs / elapsed:>12,.0f} runs/s  {legacy.parse_cache.info()}')
+
+def bench_batch(n_texts=50000):
+    texts = [make_formula(3, seed) for seed in range(n_texts)]
+
+    def run_each():
+        return [legacy.run('<bench>', text) for text in texts]
+
+    print(f'batch: {n_texts} short formulas')
+    for name, func in (('run', run_each), ('run_many', lambda: legacy.run_many('<bench>', texts))):
+        legacy.parse_cache.clear()
+        elapsed = best_of(func, repeat=3)
+        print(f'  {name:<12} {n_texts / elapsed:>12,.0f} texts/s')
+
+def bench_backends(n_terms=50, n_evals=20000):
+    text = make_formula(n_terms)
+    source, node, _ = legacy.parse_text('<bench>', text)
+    context = legacy.Context('<program>', source=source)
+    interpreter = legacy.Interpreter()
+    unboxed = legacy.UnboxedInterpreter()
+
+    backends = {
+        'interpreter': lambda context: interpreter.visit(node, context),
+        'unboxed': lambda context: unboxed.visit(node, context),
+        'closures': legacy.ClosureCompiler().compile(node).evaluate,
+        'python': legacy.PythonCompiler().compile(node).evaluate,
+        'bytecode': legacy.BytecodeCompiler().compile(node).evaluate,
+    }
+
+    print(f'backends: {n_terms}-term formula evaluated {n_evals} times')
+    for name, evaluate in backends.items():
+        def run_all():
+            for _ in range(n_evals): evaluate(context)
+
+        elapsed = best_of(run_all, repeat=3)
+        print(f'  {name:<12} {n_evals / elapsed:>12,.0f} evals/s')
+
+def bench_tiers(n_cold=2000, n_hot=10, hot_runs=2000):
+    # Mostly run-once formulas plus a few very hot ones
+    cold = [make_formula(30, seed) for seed in range(n_cold)]
+    hot = [make_formula(30, n_cold + seed) for seed in range(n_hot)]
+    workload = cold + hot * hot_runs
+    random.Random(0).shuffle(workload)
+
+    print(f'tiers: {n_cold} cold formulas, {n_hot} hot ones run {hot_runs} times each')
+    for threshold in (float('inf'), 0, 16, 256):
+        legacy.parse_cache.clear()
+        legacy.parse_cache.maxsize = n_cold + n_hot
+        legacy.tiered_runner.threshold = threshold
+        legacy.tiered_runner.reset()
+
+        start = time.perf_counter()
+        for text in workload: legacy.run('<bench>', text)
+        elapsed = time.perf_counter() - start
+
+        info = legacy.tiered_runner.info()
+        print(
+            f'  threshold={threshold:<5} {len(workload) / elapsed:>10,.0f} runs/s  '
+            f'promoted {info.promotions}, interpreted {info.interpreted_runs} in {info.interpreted_time:.2f}s, '
+            f'compiled {info.compiled_runs} in {info.compiled_time:.2f}s (+{info.compile_time:.2f}s compiling)'
+        )
+
+    legacy.tiered_runner.threshold = 16
+    legacy.tiered_runner.reset()
+
+def make_shaped(n_texts, seed=0):
+    # Formulas from a few fixed shapes with varying literals
+    rng = random.Random(seed)
+    shapes = ['({} + {}) * {} - {}', '{} / ({} - {})', '-{} * {}.5 + {}']
+    return [
+        rng.choice(shapes).format(*(rng.randint(0, 999) for _ in range(4)))
+        for _ in range(n_texts)
+    ]
+
+def bench_numpy(n_texts=100000):
+    import vectorized
+
+    texts = make_shaped(n_texts)
+    print(f'numpy: {n_texts} formulas over 3 shapes')
+
+    legacy.parse_cache.clear()
+    elapsed = best_of(lambda: legacy.run_many('<bench>', texts), repeat=1)
+    print(f'  run_many       {n_texts / elapsed:>12,.0f} texts/s')
+
+    elapsed = best_of(lambda: vectorized.evaluate_batch('<bench>', texts), repeat=1)
+    print(f'  evaluate_batch {n_texts / elapsed:>12,.0f} texts/s')
+
+def bench_columns(n_rows=1000000, n_scalar=20000):
+    import numpy as np
+    import vectorized
+
+    rng = np.random.default_rng(0)
+    price = rng.random(n_rows) * 100
+    qty = rng.integers(0, 10, n_rows)
+    text = 'price * qty - fee / qty'
+    print(f'columns: {text!r} over {n_rows} rows')
+
+    # Scalar baseline: rebind the variables and run() once per row
+    table = legacy.global_symbol_table
+    def run_rows():
+        for i in range(n_scalar):
+            table.set('price', price[i].item())
+            table.set('qty', qty[i].item())
+            table.set('fee', 1.5)
+            legacy.run('<bench>', text)
+
+    elapsed = best_of(run_rows, repeat=1)
+    print(f'  run            {n_scalar / elapsed:>12,.0f} rows/s')
+
+    elapsed = best_of(lambda: vectorized.run_vectorized(text, price=price, qty=qty, fee=1.5), repeat=3)
+    print(f'  run_vectorized {n_rows / elapsed:>12,.0f} rows/s')
+
+def bench_chunked(row_counts=(1000000, 4000000), block_sizes=(1 << 12, 1 << 14, 1 << 16)):
+    import os
+    import tempfile
+    import numpy as np
+    import vectorized
+
+    text = 'price * qty - fee / qty'
+    print(f'chunked: {text!r} from .npy files')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        out_path = os.path.join(tmp, 'out.npy')
+
+        for n_rows in row_counts:
+            rng = np.random.default_rng(0)
+            np.save(os.path.join(tmp, 'price.npy'), rng.random(n_rows) * 100)
+            np.save(os.path.join(tmp, 'qty.npy'), rng.integers(0, 10, n_rows))
+            columns = {
+                'price': os.path.join(tmp, 'price.npy'),
+                'qty': os.path.join(tmp, 'qty.npy'),
+                'fee': 1.5,
+            }
+            mapped = {name: vectorized.open_column(path) for name, path in columns.items() if name != 'fee'}
+
+            def in_memory():
+                return vectorized.run_vectorized(text, fee=1.5, **mapped)
+
+            start = time.perf_counter()
+            _, _, peak = allocated_by(in_memory)
+            elapsed = time.perf_counter() - start
+            print(f'  {n_rows} rows run_vectorized    {n_rows / elapsed:>12,.0f} rows/s  {peak / 2**20:>8.1f} MiB peak')
+
+            for block_rows in block_sizes:
+                def chunked():
+                    return vectorized.run_chunked(text, out_path, block_rows=block_rows, **columns)
+
+                start = time.perf_counter()
+                _, _, peak = allocated_by(chunked)
+                elapsed = time.perf_counter() - start
+                print(f'  {n_rows} rows block={block_rows:<7} {n_rows / elapsed:>12,.0f} rows/s  {peak / 2**20:>8.1f} MiB peak')
+
+def make_repetitive(n_levels, seed=0):
+    # Each level combines two earlier subexpressions, so the same subtrees
+    # appear over and over, as in generated formulas
+    rng = random.Random(seed)
+    parts = [f'{rng.randint(1, 99)}.5', f'{rng.randint(1, 9)}.25']
+
+    # Positive floats under + * / never reach zero (or a huge int)
+    for _ in range(n_levels):
+        left, right = rng.choice(parts[-3:]), rng.choice(parts[-3:])
+        parts.append(f'({left} {rng.choice("+*/")} {right})')
+
+    return parts[-1]
+
+def bench_dag(n_levels=16, n_evals=20):
+    text = make_repetitive(n_levels)
+    source, tree, _ = legacy.parse_text('<bench>', text)
+    context = legacy.Context('<program>', source=source)
+
+    parser = legacy.DagParser(legacy.Lexer('<bench>', text).iter_tokens(), source)
+    dag = parser.parse().node
+    print(f'dag: {len(text)} chars, {parser.interner.info()}')
+
+    def parse_tree():
+        return legacy.IterativeParser(legacy.Lexer('<bench>', text).iter_tokens(), source).parse().node
+
+    def parse_dag():
+        return legacy.DagParser(legacy.Lexer('<bench>', text).iter_tokens(), source).parse().node
+
+    for name, func in (('tree', parse_tree), ('dag', parse_dag)):
+        elapsed = best_of(func, repeat=3)
+        _, size, _ = allocated_by(func)
+        print(f'  parse {name:<8} {elapsed * 1000:>8.1f} ms  {size / 2**10:>8.1f} KiB retained')
+
+    for name, evaluate in (
+        ('tree', lambda: legacy.UnboxedInterpreter().visit(tree, context)),
+        ('dag', lambda: legacy.DagInterpreter().visit(dag, context)),
+    ):
+        elapsed = best_of(lambda: [evaluate() for _ in range(n_evals)], repeat=3)
+        print(f'  eval {name:<9} {n_evals / elapsed:>8,.0f} evals/s')
+
+def bench_limits(n_normal=2000, n_hostile=4, hostile_terms=150):
+    # Latency per run() under mixed load: ordinary formulas plus a few
+    # products of a huge variable, with max_bits on and off
+    normal = [make_formula(20, seed) for seed in range(n_normal)]
+    hostile = ['*'.join(['huge'] * hostile_terms)] * n_hostile
+    workload = normal + hostile
+    random.Random(0).shuffle(workload)
+    legacy.global_symbol_table.set('huge', 10 ** 2000)
+
+    print(f'limits: {n_normal} formulas plus {n_hostile} products of {hostile_terms} 6644-bit ints')
+    for max_bits in (legacy.default_limits.max_bits, float('inf')):
+        limits = legacy.Limits(max_bits=max_bits)
+        legacy.parse_cache.clear()
+        legacy.tiered_runner.reset()
+
+        latencies = []
+        for text in workload:
+            start = time.perf_counter()
+            legacy.run('<bench>', text, limits)
+            latencies.append(time.perf_counter() - start)
+
+        latencies.sort()
+        p50, p99 = latencies[len(latencies) // 2], latencies[len(latencies) * 99 // 100]
+        print(
+            f'  max_bits={max_bits:<6} p50 {p50 * 1e6:>8.1f} us  p99 {p99 * 1e6:>10.1f} us  '
+            f'max {latencies[-1] * 1e3:>8.1f} ms  total {sum(latencies):.2f}s'
+        )
+
+    legacy.global_symbol_table.remove('huge')
+
+def bench_parallel(n_texts=20000):
+    import os
+    import parallel
+
+    texts = [make_formula(20, seed) for seed in range(n_texts)]
+    print(f'parallel: {n_texts} formulas, {os.cpu_count()} cores')
+
+    legacy.parse_cache.clear()
+    elapsed = best_of(lambda: legacy.run_many('<bench>', texts), repeat=1)
+    print(f'  run_many       {n_texts / elapsed:>12,.0f} texts/s')
+
+    counts = sorted({1, 2, 4, os.cpu_count()})
+    for processes in counts:
+        start = time.perf_counter()
+        with parallel.BatchPool(processes) as pool:
+            # Wait for the pool to answer once before timing
+            pool.run_many('<bench>', texts[:processes])
+            startup = time.perf_counter() - start
+            elapsed = best_of(lambda: pool.run_many('<bench>', texts), repeat=1)
+        print(f'  processes={processes:<4} {n_texts / elapsed:>12,.0f} texts/s  ({startup:.2f}s startup)')
+
+def bench_threads(n_texts=20000):
+    # Run under both a regular and a free-threaded (3.13t) interpreter to
+    # compare: threads only scale when the GIL is off
+    import os
+    import parallel
+
+    texts = [make_formula(20, seed) for seed in range(n_texts)]
+    gil = getattr(sys, '_is_gil_enabled', lambda: True)()
+    build = 'GIL' if gil else 'free-threaded'
+    print(f'threads: {n_texts} formulas, {os.cpu_count()} cores, {build} build')
+
+    legacy.parse_cache.clear()
+    elapsed = best_of(lambda: legacy.run_many('<bench>', texts), repeat=1)
+    print(f'  run_many       {n_texts / elapsed:>12,.0f} texts/s')
+
+    counts = sorted({1, 2, 4, os.cpu_count()})
+    for threads in counts:
+        legacy.parse_cache.clear()
+        with parallel.ThreadBatchPool(threads) as pool:
+            elapsed = best_of(lambda: pool.run_many('<bench>', texts), repeat=1)
+        print(f'  threads={threads:<6} {n_texts / elapsed:>12,.0f} texts/s')
+
+def bench_shell(n_texts=50000):
+    import os
+    import tempfile
+    import shell
+
+    texts = [make_formula(3, seed) for seed in range(n_texts)]
+    print(f'shell: {n_texts} short formulas from a file to {os.devnull}')
+
+    legacy.parse_cache.clear()
+    elapsed = best_of(lambda: legacy.run_many('<bench>', texts), repeat=1)
+    print(f'  run_many       {n_texts / elapsed:>12,.0f} texts/s')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'formulas.txt')
+        with open(path, 'w') as f: f.write('\n'.join(texts) + '\n')
+
+        for name, formatter in shell.FORMATS.items():
+            legacy.parse_cache.clear()
+            with open(path) as f, open(os.devnull, 'w', buffering=shell.BUFFER_SIZE) as out:
+                elapsed = best_of(lambda: shell.run_stream(path, f, out, formatter), repeat=1)
+            print(f'  format={name:<7} {n_texts / elapsed:>12,.0f} texts/s')
+
+# What a short-lived job does: import, run one formula, exit. Prints the
+# modules it loaded so that bench_startup can check LAZY_MODULES
+FIRST_RESULT = "import sys, legacy; legacy.run('<stdin>', '1 + 2 * 3'); print(' '.join(sys.modules))"
+# The modules a bare interpreter loads, whatever its site setup
+BARE = "import sys; print(' '.join(sys.modules))"
+# Only imported by legacy on first use, so a first result must not load
+# them unless a bare interpreter already has
+LAZY_MODULES = (
+    'ast', 'copy', 'mmap', 'strings_with_arrows', 're', 'bisect', 'array', 'collections', 'itertools', 'threading',
+)
+# Milliseconds a first result may add to a bare interpreter's startup
+# before bench_startup fails. Measured on CPython 3.11: +0.7ms, against
+# +8.4ms with re, threading and collections imported up front and +11.6ms
+# before legacy's imports were made lazy
+STARTUP_BUDGET_MS = 3.0
+
+def pyc_is_current(path):
+    # Whether the import system will load path's cached bytecode rather
+    # than compile the source again (timestamp-based pycs only)
+    import importlib.util
+    import os
+
+    try:
+        with open(importlib.util.cache_from_source(path), 'rb') as f: header = f.read(16)
+    except OSError:
+        return False
+
+    stat = os.stat(path)
+    return (
+        header[:4] == importlib.util.MAGIC_NUMBER
+        and int.from_bytes(header[8:12], 'little') == int(stat.st_mtime) & 0xFFFFFFFF
+        and int.from_bytes(header[12:16], 'little') == stat.st_size & 0xFFFFFFFF
+    )
+
+def bench_startup(runs=20):
+    # Fails (exit status 1) on an eager import of a lazy module or a time to
+    # first result over STARTUP_BUDGET_MS. The interpreters run against their
+    # own bytecode cache, compiled before timing, so neither a stale cache
+    # in the checkout nor PYTHONDONTWRITEBYTECODE or a read-only tree
+    # counts against the code
+    import os
+    import subprocess
+    import tempfile
+
+    here = os.path.dirname(os.path.abspath(legacy.__file__))
+    cache = tempfile.TemporaryDirectory()
+    env = {name: value for name, value in os.environ.items() if name != 'PYTHONDONTWRITEBYTECODE'}
+    env['PYTHONPYCACHEPREFIX'] = cache.name
+    spawn = lambda *args: subprocess.run(
+        [sys.executable, *args], cwd=here, env=env, capture_output=True, text=True, check=True
+    )
+    failures = []
+
+    if not pyc_is_current(legacy.__file__):
+        print('note: legacy.py has no current bytecode cache here, so imports outside this benchmark '
+              'compile it each time (python -m compileall fixes that)')
+
+    # Fills the cache for this directory and everything a first result imports
+    spawn('-m', 'compileall', '-q', here)
+    spawn('-c', FIRST_RESULT)
+
+    bare = best_of(lambda: spawn('-c', 'pass'), repeat=runs)
+    first = best_of(lambda: spawn('-c', FIRST_RESULT), repeat=runs)
+    added = first - bare
+    print(f'startup: best of {runs} runs of a fresh interpreter')
+    print(f'  bare interpreter  {bare * 1e3:>7.1f}ms')
+    print(f'  first result      {first * 1e3:>7.1f}ms  (+{added * 1e3:.1f}ms, budget +{STARTUP_BUDGET_MS:.1f}ms)')
+    if added * 1e3 > STARTUP_BUDGET_MS:
+        failures.append(f'first result adds {added * 1e3:.1f}ms')
+
+    loaded = set(spawn('-c', FIRST_RESULT).stdout.split()) - set(spawn('-c', BARE).stdout.split())
+    eager = [name for name in LAZY_MODULES if name in loaded]
+    if eager: failures.append(f'imported eagerly: {", ".join(eager)}')
+
+    # -X importtime lines are "import time: self | cumulative | name", with
+    # the name indented by nesting depth. legacy's own line comes last,
+    # after the indented lines of everything it imported
+    report = spawn('-X', 'importtime', '-c', 'import legacy').stderr.splitlines()
+    rows = []
+    for line in report:
+        if not line.startswith('import time:') or 'self [us]' in line: continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(own), int(cumulative), name.strip(), len(name) - len(name.lstrip()) > 1))
+
+    own, cumulative, name, nested = rows.pop()
+    print(f'  import legacy     {cumulative / 1e3:>7.1f}ms  ({own / 1e3:.1f}ms in legacy itself), slowest imports:')
+    imported = []
+    while rows and rows[-1][3]: imported.append(rows.pop())
+    for own, cumulative, name, nested in sorted(imported, reverse=True)[:5]:
+        print(f'    {name:<18} {own / 1e3:>6.1f}ms')
+
+    cache.cleanup()
+    if failures: sys.exit('startup regression: ' + '; '.join(failures))
+
+def bench_server(n_texts=20000, n_sequential=2000):
+    import asyncio
+    import os
+    import tempfile
+    import server
+
+    # Short formulas, so that the time measured is mostly the server's own
+    texts = [make_formula(3, seed) for seed in range(n_texts)]
+    print(f'server: {n_sequential} one at a time, then {n_texts} pipelined, over a Unix socket')
+
+    async def measure(batch_size, path):
+        srv = await server.EvalServer(batch_size=batch_size).start(path=path)
+        async with await server.EvalClient.connect(path=path) as client:
+            latencies = []
+            for text in texts[:n_sequential]:
+                start = time.perf_counter()
+                await client.evaluate(text)
+                latencies.append(time.perf_counter() - start)
+
+            batches = srv.batches
+            start = time.perf_counter()
+            await client.evaluate_many(texts)
+            elapsed = time.perf_counter() - start
+            batches = srv.batches - batches
+        await srv.close()
+
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1e6
+        p99 = latencies[len(latencies) * 99 // 100] * 1e6
+        print(f'  batch_size={batch_size:<4} p50 {p50:>7.0f}us  p99 {p99:>7.0f}us  '
+              f'pipelined {n_texts / elapsed:>9,.0f} req/s  ({n_texts / batches:.1f} per batch)')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for batch_size in (1, 16, server.BATCH_SIZE):
+            legacy.parse_cache.clear()
+            asyncio.run(measure(batch_size, os.path.join(tmp, f'server-{batch_size}')))
+
+BENCHMARKS = {
+    'lexer': bench_lexer,
+    'parser': bench_parser,
+    'cache': bench_cache,
+    'batch': bench_batch,
+    'backends': bench_backends,
+    'tiers': bench_tiers,
+    'numpy': bench_numpy,
+    'columns': bench_columns,
+    'chunked': bench_chunked,
+    'dag': bench_dag,
+    'limits': bench_limits,
+    'parallel': bench_parallel,
+    'threads': bench_threads,
+    'server': bench_server,
+    'shell': bench_shell,
+    'startup': bench_startup,
+    'memory': bench_memory,
+}
+
+#######################################
+# MAIN
+#######################################
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            sys.exit(f'Unknown benchmark {name!r}, choose from: {", ".join(BENCHMARKS)}')
+        BENCHMARKS[name]()
@@ -2,13 +2,63 @@
 # IMPORTS
 #######################################
 
-from strings_with_arrows import *
+import _thread
+import _weakref
+import marshal
+import os
+import time
+from _collections import OrderedDict, deque
+
+class LazyModule:
+    # Imports the named module on first attribute access, then keeps each
+    # attribute it is asked for. For modules only some paths need, so that
+    # importing this one and running a first formula stay cheap
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attr):
+        value = getattr(__import__(self.name), attr)
+        setattr(self, attr, value)
+        return value
+
+class LazyNamedTuple:
+    # Makes the namedtuple type on first use and puts it in this module's
+    # globals in its own place. Making the types up front, and importing
+    # collections for them, would be most of this module's import time
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.type = None
+
+    def __call__(self, *args):
+        if self.type is None:
+            self.type = globals()[self.name] = collections.namedtuple(self.name, self.fields)
+        return self.type(*args)
+
+# Compiling to Python (on promotion), rebinding cached errors, mapping
+# files, rendering errors and lexing past the first text
+py_ast = LazyModule('ast')
+copy = LazyModule('copy')
+mmap = LazyModule('mmap')
+strings_with_arrows = LazyModule('strings_with_arrows')
+re = LazyModule('re')
+bisect = LazyModule('bisect')
+# Token and bytecode arrays, the namedtuples returned by info() and
+# batches in iter_run
+array = LazyModule('array')
+collections = LazyModule('collections')
+itertools = LazyModule('itertools')
 
 #######################################
 # CONSTANTS
 #######################################
 
 DIGITS = '0123456789'
+LETTERS = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+LETTERS_DIGITS = LETTERS + DIGITS
+
+# log10(2): an n-bit int has at most n * DIGITS_PER_BIT + 1 decimal digits
+DIGITS_PER_BIT = 0.30103
 
 #######################################
 # ERRORS
@@ -24,9 +74,16 @@ class Error:
     def as_string(self):
         result  = f'{self.error_name}: {self.details}\n'
         result += f'File {self.pos_start.fn}, line {self.pos_start.ln + 1}'
-        result += '\n\n' + string_with_arrows(self.pos_start.ftxt, self.pos_start, self.pos_end)
+        result += '\n\n' + strings_with_arrows.string_with_arrows(*self.pos_start.source.excerpt(self.pos_start.idx, self.pos_end.idx))
         return result
 
+    def rebind(self, source):
+        # Same error against another Source over identical text
+        error = copy.copy(self)
+        error.pos_start = source.pos(self.pos_start.idx)
+        error.pos_end = source.pos(self.pos_end.idx)
+        return error
+
 class IllegalCharError(Error):
     def __init__(self, pos_start, pos_end, details):
         super().__init__(pos_start, pos_end, 'Illegal Character', details)
@@ -35,6 +92,12 @@ class InvalidSyntaxError(Error):
     def __init__(self, pos_start, pos_end, details=''):
         super().__init__(pos_start, pos_end, 'Invalid Syntax', details)
 
+class ParseError(Exception):
+    # Carries an InvalidSyntaxError out of DirectParser's productions
+    def __init__(self, error):
+        super().__init__(error.details)
+        self.error = error
+
 class RTError(Error):
     def __init__(self, pos_start, pos_end, details, context):
         super().__init__(pos_start, pos_end, 'Runtime Error', details)
@@ -43,7 +106,7 @@ class RTError(Error):
     def as_string(self):
         result  = self.generate_traceback()
         result += f'{self.error_name}: {self.details}'
-        result += '\n\n' + string_with_arrows(self.pos_start.ftxt, self.pos_start, self.pos_end)
+        result += '\n\n' + strings_with_arrows.string_with_arrows(*self.pos_start.source.excerpt(self.pos_start.idx, self.pos_end.idx))
         return result
 
     def generate_traceback(self):
@@ -58,30 +121,130 @@ class RTError(Error):
 
         return 'Traceback (most recent call last):\n' + result
 
+class EvalError(Exception):
+    # Carries an RTError out of compiled code
+    def __init__(self, error):
+        super().__init__(error.details)
+        self.error = error
+
 #######################################
 # POSITION
 #######################################
 
+class Source:
+    # line is the index of text's first line in fn, for text taken from
+    # further down a file
+    def __init__(self, fn, text, line=0):
+        self.fn = fn
+        self.text = text
+        self.line = line
+        self.line_starts = None
+
+    def line_col(self, idx):
+        # Line index is only built once an error actually gets rendered
+        if self.line_starts is None:
+            self.line_starts = [0] + [match.end() for match in re.finditer('\n', self.text)]
+
+        ln = bisect.bisect_right(self.line_starts, idx) - 1
+        return self.line + ln, idx - self.line_starts[ln]
+
+    def pos(self, idx):
+        return Position(idx, self)
+
+    def char_at(self, idx):
+        return self.text[idx]
+
+    def excerpt(self, idx_start, idx_end):
+        # (text, pos_start, pos_end) for string_with_arrows to render a span
+        return self.text, self.pos(idx_start), self.pos(idx_end)
+
+class BufferSource(Source):
+    # Source over a bytes-like buffer such as an mmap. Rendering an error
+    # decodes only the lines its span covers, and line numbers come from
+    # counting newlines a chunk at a time, so the whole buffer is never
+    # copied. Every character before the first illegal one is ASCII, so
+    # byte offsets and str offsets agree
+    CHUNK = 1 << 16
+
+    def __init__(self, fn, buffer):
+        self.fn = fn
+        self.buffer = buffer
+        self.line = 0
+        self.line_starts = None
+        self._text = None
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = bytes(self.buffer).decode('utf-8', 'replace')
+        return self._text
+
+    def line_col(self, idx):
+        ln = 0
+        line_start = 0
+        for start in range(0, min(idx, len(self.buffer)), self.CHUNK):
+            chunk = bytes(self.buffer[start:min(start + self.CHUNK, idx)])
+            count = chunk.count(b'\n')
+            if count:
+                ln += count
+                line_start = start + chunk.rfind(b'\n') + 1
+        return self.line + ln, idx - line_start
+
+    def newline_before(self, idx):
+        # Offset of the last newline before idx, or -1
+        while idx > 0:
+            start = max(idx - self.CHUNK, 0)
+            found = bytes(self.buffer[start:idx]).rfind(b'\n')
+            if found >= 0: return start + found
+            idx = start
+        return -1
+
+    def newline_from(self, idx):
+        # Offset of the first newline at or after idx, or the buffer's length
+        while idx < len(self.buffer):
+            found = bytes(self.buffer[idx:idx + self.CHUNK]).find(b'\n')
+            if found >= 0: return idx + found
+            idx += self.CHUNK
+        return len(self.buffer)
+
+    def excerpt(self, idx_start, idx_end):
+        # The lines of the span, starting from the newline before them as
+        # string_with_arrows would slice them out of the whole text, so the
+        # rendering is the same. One more line is taken: a span from a
+        # newline at offset 0 makes string_with_arrows run on into it
+        start = max(self.newline_before(idx_start), 0)
+        end = self.newline_from(self.newline_from(max(idx_end, start)) + 1)
+        text = bytes(self.buffer[start:end]).decode('utf-8', 'replace')
+
+        source = Source(self.fn, text, self.line_col(start)[0])
+        return text, source.pos(idx_start - start), source.pos(idx_end - start)
+
+    def char_at(self, idx):
+        return bytes(self.buffer[idx:idx + 4]).decode('utf-8', 'replace')[0]
+
 class Position:
-    def __init__(self, idx, ln, col, fn, ftxt):
+    def __init__(self, idx, source):
         self.idx = idx
-        self.ln = ln
-        self.col = col
-        self.fn = fn
-        self.ftxt = ftxt
+        self.source = source
 
-    def advance(self, current_char=None):
-        self.idx += 1
-        self.col += 1
+    @property
+    def ln(self):
+        return self.source.line_col(self.idx)[0]
 
-        if current_char == '\n':
-            self.ln += 1
-            self.col = 0
+    @property
+    def col(self):
+        return self.source.line_col(self.idx)[1]
 
-        return self
+    @property
+    def fn(self):
+        return self.source.fn
+
+    @property
+    def ftxt(self):
+        return self.source.text
 
     def copy(self):
-        return Position(self.idx, self.ln, self.col, self.fn, self.ftxt)
+        return Position(self.idx, self.source)
 
 #######################################
 # TOKENS
@@ -89,6 +252,7 @@ class Position:
 
 TT_INT       = 'INT'
 TT_FLOAT     = 'FLOAT'
+TT_IDENTIFIER = 'IDENTIFIER'
 TT_PLUS      = 'PLUS'
 TT_MINUS     = 'MINUS'
 TT_MUL       = 'MUL'
@@ -98,37 +262,201 @@ TT_RPAREN    = 'RPAREN'
 TT_EOF       = 'EOF'
 
 class Token:
+    __slots__ = ('type', 'value', 'pos_start', 'pos_end')
+
     def __init__(self, type_, value=None, pos_start=None, pos_end=None):
         self.type = type_
         self.value = value
 
-        if pos_start:
-            self.pos_start = pos_start.copy()
-            self.pos_end = pos_start.copy()
-            self.pos_end.advance()
+        # Positions are plain offsets into the source text
+        if pos_start is not None:
+            self.pos_start = pos_start
+            self.pos_end = pos_start + 1
 
-        if pos_end:
+        if pos_end is not None:
             self.pos_end = pos_end
     
     def __repr__(self):
         if self.value: return f'{self.type}:{self.value}'
         return f'{self.type}'
 
+#######################################
+# TOKEN BUFFER
+#######################################
+
+TOKEN_TYPES = (TT_INT, TT_FLOAT, TT_PLUS, TT_MINUS, TT_MUL, TT_DIV, TT_LPAREN, TT_RPAREN, TT_EOF, TT_IDENTIFIER)
+TOKEN_CODES = {type_: code for code, type_ in enumerate(TOKEN_TYPES)}
+
+# The same codes by name, for code that reads TokenBuffer.types directly
+(
+    CODE_INT, CODE_FLOAT, CODE_PLUS, CODE_MINUS, CODE_MUL, CODE_DIV,
+    CODE_LPAREN, CODE_RPAREN, CODE_EOF, CODE_IDENTIFIER
+) = range(len(TOKEN_TYPES))
+
+class TokenBuffer:
+    # Struct-of-arrays token storage: a type code byte and two offsets per
+    # token, with INT/FLOAT values and IDENTIFIER names in a side table
+    # (None for other tokens)
+    def __init__(self):
+        self.types = array.array('B')
+        self.starts = array.array('q')
+        self.ends = array.array('q')
+        self.values = []
+
+    def append(self, type_, value, pos_start, pos_end):
+        self.types.append(TOKEN_CODES[type_])
+        self.starts.append(pos_start)
+        self.ends.append(pos_end)
+        self.values.append(value)
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, idx):
+        if not -len(self) <= idx < len(self): raise IndexError('token index out of range')
+        return TokenView(self, idx % len(self))
+
+    def token(self, idx):
+        # A standalone Token for one slot, which does not keep the buffer alive
+        return Token(TOKEN_TYPES[self.types[idx]], self.values[idx], self.starts[idx], self.ends[idx])
+
+    def __iter__(self):
+        # Views for inspection; BufferParser reads the arrays instead
+        for idx in range(len(self.types)):
+            yield TokenView(self, idx)
+
+    def __repr__(self):
+        return repr(list(self))
+
+class TokenView:
+    # Read-only Token look-alike over one slot of a TokenBuffer
+    __slots__ = ('buffer', 'idx')
+
+    def __init__(self, buffer, idx):
+        self.buffer = buffer
+        self.idx = idx
+
+    @property
+    def type(self):
+        return TOKEN_TYPES[self.buffer.types[self.idx]]
+
+    @property
+    def value(self):
+        return self.buffer.values[self.idx]
+
+    @property
+    def pos_start(self):
+        return self.buffer.starts[self.idx]
+
+    @property
+    def pos_end(self):
+        return self.buffer.ends[self.idx]
+
+    __repr__ = Token.__repr__
+
 #######################################
 # LEXER
 #######################################
 
+# Group names double as token types, so match.lastgroup is the type
+TOKEN_PATTERN = '|'.join([
+    r'(?P<SKIP>[ \t]+)',
+    rf'(?P<{TT_FLOAT}>[0-9]+\.[0-9]*)',
+    rf'(?P<{TT_INT}>[0-9]+)',
+    rf'(?P<{TT_IDENTIFIER}>[A-Za-z][A-Za-z0-9_]*)',
+    rf'(?P<{TT_PLUS}>\+)',
+    rf'(?P<{TT_MINUS}>-)',
+    rf'(?P<{TT_MUL}>\*)',
+    rf'(?P<{TT_DIV}>/)',
+    rf'(?P<{TT_LPAREN}>\()',
+    rf'(?P<{TT_RPAREN}>\))',
+    r'(?P<ILLEGAL>.)',
+])
+# Compiled by token_regex for the second str text lexed
+TOKEN_REGEX = None
+first_text_lexed = False
+
+SINGLE_CHAR_TYPES = {
+    '+': TT_PLUS, '-': TT_MINUS, '*': TT_MUL, '/': TT_DIV, '(': TT_LPAREN, ')': TT_RPAREN,
+}
+
+class CharMatch:
+    # The parts of a re.Match that the lexer uses
+    __slots__ = ('lastgroup', 'string', 'idx_start', 'idx_end')
+
+    def __init__(self, lastgroup, string, idx_start, idx_end):
+        self.lastgroup = lastgroup
+        self.string = string
+        self.idx_start = idx_start
+        self.idx_end = idx_end
+
+    def start(self):
+        return self.idx_start
+
+    def end(self):
+        return self.idx_end
+
+    def group(self):
+        return self.string[self.idx_start:self.idx_end]
+
+class CharScanner:
+    # Finds the same matches as TOKEN_REGEX, a character at a time
+    @staticmethod
+    def finditer(text):
+        idx = 0
+        while idx < len(text):
+            idx_start = idx
+            char = text[idx]
+            idx += 1
+
+            if char in ' \t':
+                while idx < len(text) and text[idx] in ' \t': idx += 1
+                type_ = 'SKIP'
+            elif char in DIGITS:
+                while idx < len(text) and text[idx] in DIGITS: idx += 1
+                type_ = TT_INT
+                if idx < len(text) and text[idx] == '.':
+                    idx += 1
+                    while idx < len(text) and text[idx] in DIGITS: idx += 1
+                    type_ = TT_FLOAT
+            elif char in LETTERS:
+                while idx < len(text) and (text[idx] in LETTERS_DIGITS or text[idx] == '_'): idx += 1
+                type_ = TT_IDENTIFIER
+            else:
+                type_ = SINGLE_CHAR_TYPES.get(char, 'ILLEGAL')
+
+            yield CharMatch(type_, text, idx_start, idx)
+
+def token_regex(text):
+    # The first str text is matched by CharScanner instead: compiling the
+    # regex means importing re, which takes longer than all the rest of a
+    # first result. Only buffers from run_file need the bytes form, so it
+    # is compiled on first use and found in re's own cache after that
+    global TOKEN_REGEX, first_text_lexed
+    if not isinstance(text, str): return re.compile(TOKEN_PATTERN.encode(), re.DOTALL)
+
+    if TOKEN_REGEX is None:
+        if not first_text_lexed:
+            first_text_lexed = True
+            return CharScanner
+        TOKEN_REGEX = re.compile(TOKEN_PATTERN, re.DOTALL)
+    return TOKEN_REGEX
+
 class Lexer:
-    def __init__(self, fn, text):
+    def __init__(self, fn, text, limits=None):
         self.fn = fn
         self.text = text
-        self.pos = Position(-1, 0, -1, fn, text)
+        self.source = Source(fn, text) if isinstance(text, str) else BufferSource(fn, text)
+        self.limits = limits
+        self.nodes = 0
+        self.error = None
+        self.idx = -1
         self.current_char = None
         self.advance()
     
     def advance(self):
-        self.pos.advance(self.current_char)
-        self.current_char = self.text[self.pos.idx] if self.pos.idx < len(self.text) else None
+        self.idx += 1
+        self.current_char = self.text[self.idx] if self.idx < len(self.text) else None
 
     def make_tokens(self):
         tokens = []
@@ -138,37 +466,116 @@ class Lexer:
                 self.advance()
             elif self.current_char in DIGITS:
                 tokens.append(self.make_number())
+            elif self.current_char in LETTERS:
+                tokens.append(self.make_identifier())
             elif self.current_char == '+':
-                tokens.append(Token(TT_PLUS, pos_start=self.pos))
+                tokens.append(Token(TT_PLUS, pos_start=self.idx))
                 self.advance()
             elif self.current_char == '-':
-                tokens.append(Token(TT_MINUS, pos_start=self.pos))
+                tokens.append(Token(TT_MINUS, pos_start=self.idx))
                 self.advance()
             elif self.current_char == '*':
-                tokens.append(Token(TT_MUL, pos_start=self.pos))
+                tokens.append(Token(TT_MUL, pos_start=self.idx))
                 self.advance()
             elif self.current_char == '/':
-                tokens.append(Token(TT_DIV, pos_start=self.pos))
+                tokens.append(Token(TT_DIV, pos_start=self.idx))
                 self.advance()
             elif self.current_char == '(':
-                tokens.append(Token(TT_LPAREN, pos_start=self.pos))
+                tokens.append(Token(TT_LPAREN, pos_start=self.idx))
                 self.advance()
             elif self.current_char == ')':
-                tokens.append(Token(TT_RPAREN, pos_start=self.pos))
+                tokens.append(Token(TT_RPAREN, pos_start=self.idx))
                 self.advance()
             else:
-                pos_start = self.pos.copy()
+                pos_start = self.idx
                 char = self.current_char
                 self.advance()
-                return [], IllegalCharError(pos_start, self.pos, "'" + char + "'")
+                return [], IllegalCharError(self.source.pos(pos_start), self.source.pos(self.idx), "'" + char + "'")
+
+        tokens.append(Token(TT_EOF, pos_start=self.idx))
+        return tokens, None
 
-        tokens.append(Token(TT_EOF, pos_start=self.pos))
+    def scan_tokens(self):
+        # Single pass over TOKEN_REGEX; produces the same tokens as make_tokens
+        tokens = list(self.iter_tokens())
+        if self.error: return [], self.error
         return tokens, None
 
+    def iter_tokens(self):
+        # Yields tokens on demand. An illegal character sets self.error and
+        # ends the stream with EOF, so consumers always see a terminated stream.
+        # self.text may also be a bytes-like buffer (see run_file). With
+        # limits, self.nodes counts the nodes the tokens will make, and going
+        # over max_nodes or max_bits ends the stream the same way
+        regex = token_regex(self.text)
+        max_nodes = self.limits.max_nodes if self.limits else float('inf')
+
+        for match in regex.finditer(self.text):
+            type_ = match.lastgroup
+            if type_ == 'SKIP': continue
+
+            # Every token but a parenthesis becomes exactly one node
+            if type_ != TT_LPAREN and type_ != TT_RPAREN:
+                self.nodes += 1
+                if self.nodes > max_nodes:
+                    self.error = limit_exceeded(self.source, match.start(), match.end(), f'Expression exceeds {max_nodes} nodes')
+                    yield Token(TT_EOF, pos_start=match.start())
+                    return
+
+            if type_ == TT_INT:
+                value = self.make_int(match)
+                if value is None:
+                    yield Token(TT_EOF, pos_start=match.start())
+                    return
+                yield Token(TT_INT, value, match.start(), match.end())
+            elif type_ == TT_FLOAT:
+                yield Token(TT_FLOAT, float(match.group()), match.start(), match.end())
+            elif type_ == TT_IDENTIFIER:
+                yield Token(TT_IDENTIFIER, self.identifier(match), match.start(), match.end())
+            elif type_ == 'ILLEGAL':
+                idx = match.start()
+                self.error = IllegalCharError(self.source.pos(idx), self.source.pos(idx + 1), "'" + self.source.char_at(idx) + "'")
+                yield Token(TT_EOF, pos_start=idx)
+                return
+            else:
+                yield Token(type_, pos_start=match.start())
+
+        yield Token(TT_EOF, pos_start=len(self.text))
+
+    def buffer_tokens(self):
+        # Same scan as iter_tokens, written straight into a TokenBuffer
+        buffer = TokenBuffer()
+        types, starts, ends, values = buffer.types, buffer.starts, buffer.ends, buffer.values
+        regex = token_regex(self.text)
+
+        for match in regex.finditer(self.text):
+            type_ = match.lastgroup
+            if type_ == 'SKIP': continue
+
+            if type_ == TT_INT:
+                value = int(match.group())
+            elif type_ == TT_FLOAT:
+                value = float(match.group())
+            elif type_ == TT_IDENTIFIER:
+                value = self.identifier(match)
+            elif type_ == 'ILLEGAL':
+                idx = match.start()
+                return TokenBuffer(), IllegalCharError(self.source.pos(idx), self.source.pos(idx + 1), "'" + self.source.char_at(idx) + "'")
+            else:
+                value = None
+
+            types.append(TOKEN_CODES[type_])
+            starts.append(match.start())
+            ends.append(match.end())
+            values.append(value)
+
+        buffer.append(TT_EOF, None, len(self.text), len(self.text) + 1)
+        return buffer, None
+
     def make_number(self):
         num_str = ''
         dot_count = 0
-        pos_start = self.pos.copy()
+        pos_start = self.idx
 
         while self.current_char != None and self.current_char in DIGITS + '.':
             if self.current_char == '.':
@@ -180,15 +587,59 @@ class Lexer:
             self.advance()
 
         if dot_count == 0:
-            return Token(TT_INT, int(num_str), pos_start, self.pos)
+            return Token(TT_INT, int(num_str), pos_start, self.idx)
         else:
-            return Token(TT_FLOAT, float(num_str), pos_start, self.pos)
+            return Token(TT_FLOAT, float(num_str), pos_start, self.idx)
+
+    def make_identifier(self):
+        id_str = ''
+        pos_start = self.idx
+
+        while self.current_char != None and self.current_char in LETTERS_DIGITS + '_':
+            id_str += self.current_char
+            self.advance()
+
+        return Token(TT_IDENTIFIER, id_str, pos_start, self.idx)
+
+    def make_int(self, match):
+        # The INT literal's value, or None with self.error set if it is over
+        # max_bits. int() of a long digit string is slow, and past
+        # sys.get_int_max_str_digits() raises, so the length is checked first
+        digits = match.group()
+        if self.limits is None: return int(digits)
+
+        max_bits = self.limits.max_bits
+        max_digits = max_bits * DIGITS_PER_BIT + 1
+
+        # Leading zeros are only stripped from literals that look too long
+        if len(digits) > max_digits:
+            zero = '0' if isinstance(digits, str) else b'0'
+            digits = digits.lstrip(zero) or zero
+
+        if len(digits) <= max_digits:
+            value = int(digits)
+            if value.bit_length() <= max_bits: return value
+
+        self.error = limit_exceeded(self.source, match.start(), match.end(), f'Number literal exceeds {max_bits} bits')
+        return None
+
+    @staticmethod
+    def identifier(match):
+        # Names are always str, also when lexing a bytes buffer
+        name = match.group()
+        return name if isinstance(name, str) else name.decode('ascii')
 
 #######################################
 # NODES
 #######################################
 
+# Nodes are slotted: parsed formulas are kept around in bulk, and a
+# per-instance __dict__ would dominate their size. Nothing changes a node
+# once parse_text() has returned it, so threads share cached trees freely
+
 class NumberNode:
+    __slots__ = ('tok', 'pos_start', 'pos_end')
+
     def __init__(self, tok):
         self.tok = tok
 
@@ -198,7 +649,21 @@ class NumberNode:
     def __repr__(self):
         return f'{self.tok}'
 
+class VarAccessNode:
+    __slots__ = ('var_name_tok', 'pos_start', 'pos_end')
+
+    def __init__(self, var_name_tok):
+        self.var_name_tok = var_name_tok
+
+        self.pos_start = self.var_name_tok.pos_start
+        self.pos_end = self.var_name_tok.pos_end
+
+    def __repr__(self):
+        return f'{self.var_name_tok}'
+
 class BinOpNode:
+    __slots__ = ('left_node', 'op_tok', 'right_node', 'pos_start', 'pos_end')
+
     def __init__(self, left_node, op_tok, right_node):
         self.left_node = left_node
         self.op_tok = op_tok
@@ -211,6 +676,8 @@ class BinOpNode:
         return f'({self.left_node}, {self.op_tok}, {self.right_node})'
 
 class UnaryOpNode:
+    __slots__ = ('op_tok', 'node', 'pos_start', 'pos_end')
+
     def __init__(self, op_tok, node):
         self.op_tok = op_tok
         self.node = node
@@ -221,6 +688,76 @@ class UnaryOpNode:
     def __repr__(self):
         return f'({self.op_tok}, {self.node})'
 
+def postorder(node, done=None):
+    # Yields the nodes of an AST children first, left to right, from an
+    # explicit stack so any depth works. A node whose id is in done is
+    # skipped with its subtree; a caller that records each node it is given
+    # there (as DagInterpreter does with its values) sees a DAG's shared
+    # nodes only once
+
+    # Entries are (node, children_done)
+    stack = [(node, False)]
+    while stack:
+        current, children_done = stack.pop()
+        if done is not None and id(current) in done: continue
+
+        if children_done or (current.__class__ is not BinOpNode and current.__class__ is not UnaryOpNode):
+            yield current
+        elif current.__class__ is BinOpNode:
+            stack.append((current, True))
+            stack.append((current.right_node, False))
+            stack.append((current.left_node, False))
+        else:
+            stack.append((current, True))
+            stack.append((current.node, False))
+
+#######################################
+# HASH CONSING
+#######################################
+
+DagInfo = LazyNamedTuple('DagInfo', ['nodes', 'unique', 'ratio'])
+
+class NodeInterner:
+    # Hash-conses ASTs: structurally equal subtrees are replaced by one
+    # shared node, which turns the tree into a DAG. A node's key holds the
+    # ids of its already interned children, so finding its twin is a single
+    # dict lookup. nodes counts the tree nodes seen, unique the ones kept
+    def __init__(self):
+        self.table = {}
+        self.nodes = 0
+
+    def intern(self, node):
+        # Interns node's subtrees bottom-up, in place, and returns the shared
+        # node for it. Every node keeps the span it was parsed with, computed
+        # before its children were swapped for shared ones, but a shared node
+        # only has the span of its first occurrence
+        interned = []
+
+        for current in postorder(node):
+            if isinstance(current, BinOpNode):
+                current.right_node = interned.pop()
+                current.left_node = interned.pop()
+                key = (current.op_tok.type, id(current.left_node), id(current.right_node))
+
+            elif isinstance(current, UnaryOpNode):
+                current.node = interned.pop()
+                key = (current.op_tok.type, id(current.node))
+
+            elif isinstance(current, NumberNode):
+                key = (current.tok.type, current.tok.value)
+            else:
+                key = (TT_IDENTIFIER, current.var_name_tok.value)
+
+            self.nodes += 1
+            interned.append(self.table.setdefault(key, current))
+
+        return interned.pop()
+
+    def info(self):
+        # ratio is tree nodes per DAG node, 1.0 when nothing repeats
+        unique = len(self.table)
+        return DagInfo(self.nodes, unique, self.nodes / unique if unique else 1.0)
+
 #######################################
 # PARSE RESULT
 #######################################
@@ -250,22 +787,23 @@ class ParseResult:
 #######################################
 
 class Parser:
-    def __init__(self, tokens):
-        self.tokens = tokens
-        self.tok_idx = -1
+    def __init__(self, tokens, source):
+        # tokens may be a list or a lazy iterator such as Lexer.iter_tokens();
+        # only current_tok is ever looked at, so nothing else is buffered
+        self.tokens = iter(tokens)
+        self.source = source
+        self.current_tok = None
         self.advance()
 
     def advance(self, ):
-        self.tok_idx += 1
-        if self.tok_idx < len(self.tokens):
-            self.current_tok = self.tokens[self.tok_idx]
+        self.current_tok = next(self.tokens, self.current_tok)
         return self.current_tok
 
     def parse(self):
         res = self.expr()
         if not res.error and self.current_tok.type != TT_EOF:
             return res.failure(InvalidSyntaxError(
-                self.current_tok.pos_start, self.current_tok.pos_end,
+                self.source.pos(self.current_tok.pos_start), self.source.pos(self.current_tok.pos_end),
                 "Expected '+', '-', '*' or '/'"
             ))
         return res
@@ -286,6 +824,10 @@ class Parser:
             res.register(self.advance())
             return res.success(NumberNode(tok))
 
+        elif tok.type == TT_IDENTIFIER:
+            res.register(self.advance())
+            return res.success(VarAccessNode(tok))
+
         elif tok.type == TT_LPAREN:
             res.register(self.advance())
             expr = res.register(self.expr())
@@ -295,13 +837,13 @@ class Parser:
                 return res.success(expr)
             else:
                 return res.failure(InvalidSyntaxError(
-                    self.current_tok.pos_start, self.current_tok.pos_end,
+                    self.source.pos(self.current_tok.pos_start), self.source.pos(self.current_tok.pos_end),
                     "Expected ')'"
                 ))
 
         return res.failure(InvalidSyntaxError(
-            tok.pos_start, tok.pos_end,
-            "Expected int or float"
+            self.source.pos(tok.pos_start), self.source.pos(tok.pos_end),
+            "Expected int, float or identifier"
         ))
 
     def term(self):
@@ -326,6 +868,201 @@ class Parser:
 
         return res.success(left)
 
+class DirectParser(Parser):
+    # Productions return nodes directly and raise ParseError on a syntax
+    # error, which parse() turns back into a ParseResult. Nothing is
+    # allocated on the success path beyond the nodes themselves
+    def parse(self):
+        res = ParseResult()
+
+        try:
+            res.success(self.expr())
+            if self.current_tok.type != TT_EOF:
+                raise self.syntax_error(self.current_tok, "Expected '+', '-', '*' or '/'")
+        except ParseError as e:
+            return res.failure(e.error)
+
+        return res
+
+    def syntax_error(self, tok, details):
+        return ParseError(InvalidSyntaxError(
+            self.source.pos(tok.pos_start), self.source.pos(tok.pos_end),
+            details
+        ))
+
+    ###################################
+
+    def factor(self):
+        tok = self.current_tok
+
+        if tok.type in (TT_PLUS, TT_MINUS):
+            self.advance()
+            return UnaryOpNode(tok, self.factor())
+
+        elif tok.type in (TT_INT, TT_FLOAT):
+            self.advance()
+            return NumberNode(tok)
+
+        elif tok.type == TT_IDENTIFIER:
+            self.advance()
+            return VarAccessNode(tok)
+
+        elif tok.type == TT_LPAREN:
+            self.advance()
+            expr = self.expr()
+            if self.current_tok.type != TT_RPAREN:
+                raise self.syntax_error(self.current_tok, "Expected ')'")
+            self.advance()
+            return expr
+
+        raise self.syntax_error(tok, "Expected int, float or identifier")
+
+    ###################################
+
+    def bin_op(self, func, ops):
+        left = func()
+
+        while self.current_tok.type in ops:
+            op_tok = self.current_tok
+            self.advance()
+            left = BinOpNode(left, op_tok, func())
+
+        return left
+
+class IterativeParser(DirectParser):
+    # Precedence climbing over an explicit stack instead of a Python frame
+    # per nesting level. Builds the same trees and reports the same errors
+    # as Parser, in linear time and with no depth limit.
+    #
+    # Stack entries are (left_node, tok): left_node is None for a prefix
+    # '+'/'-' or '(' waiting on its operand, otherwise tok is a binary
+    # operator waiting on its right operand
+    def expr(self):
+        stack = []
+
+        while True:
+            # Prefix operators and parentheses up to the next operand
+            tok = self.current_tok
+            while tok.type in (TT_PLUS, TT_MINUS, TT_LPAREN):
+                stack.append((None, tok))
+                tok = self.advance()
+
+            if tok.type in (TT_INT, TT_FLOAT):
+                node = NumberNode(tok)
+            elif tok.type == TT_IDENTIFIER:
+                node = VarAccessNode(tok)
+            else:
+                raise self.syntax_error(tok, "Expected int, float or identifier")
+            self.advance()
+
+            # Reduce until an operator needs another operand
+            while True:
+                while stack and stack[-1][0] is None and stack[-1][1].type != TT_LPAREN:
+                    node = UnaryOpNode(stack.pop()[1], node)
+
+                if stack and stack[-1][1].type in (TT_MUL, TT_DIV):
+                    left, op_tok = stack.pop()
+                    node = BinOpNode(left, op_tok, node)
+                if self.current_tok.type in (TT_MUL, TT_DIV): break
+
+                if stack and stack[-1][0] is not None:
+                    left, op_tok = stack.pop()
+                    node = BinOpNode(left, op_tok, node)
+                if self.current_tok.type in (TT_PLUS, TT_MINUS): break
+
+                if not stack: return node
+
+                # Only an open '(' can be left on top here
+                if self.current_tok.type != TT_RPAREN:
+                    raise self.syntax_error(self.current_tok, "Expected ')'")
+                stack.pop()
+                self.advance()
+
+            stack.append((node, self.current_tok))
+            self.advance()
+
+class BufferParser(IterativeParser):
+    # IterativeParser over a TokenBuffer, walking its arrays with an index
+    # instead of a cursor of token objects. Only the tokens a node keeps
+    # (numbers, names and operators) become Tokens, holding their own
+    # offsets and value, so the tree does not keep the buffer alive
+    def __init__(self, buffer, source):
+        self.buffer = buffer
+        self.source = source
+        self.idx = 0
+
+    def parse(self):
+        res = ParseResult()
+
+        try:
+            res.success(self.expr())
+            if self.buffer.types[self.idx] != CODE_EOF:
+                raise self.syntax_error(self.buffer.token(self.idx), "Expected '+', '-', '*' or '/'")
+        except ParseError as e:
+            return res.failure(e.error)
+
+        return res
+
+    def expr(self):
+        # IterativeParser.expr on type codes; stack entries hold the index
+        # of their token rather than the token
+        types = self.buffer.types
+        token = self.buffer.token
+        idx = self.idx
+        stack = []
+
+        while True:
+            while types[idx] in (CODE_PLUS, CODE_MINUS, CODE_LPAREN):
+                stack.append((None, idx))
+                idx += 1
+
+            code = types[idx]
+            if code == CODE_INT or code == CODE_FLOAT:
+                node = NumberNode(token(idx))
+            elif code == CODE_IDENTIFIER:
+                node = VarAccessNode(token(idx))
+            else:
+                raise self.syntax_error(token(idx), "Expected int, float or identifier")
+            idx += 1
+
+            while True:
+                while stack and stack[-1][0] is None and types[stack[-1][1]] != CODE_LPAREN:
+                    node = UnaryOpNode(token(stack.pop()[1]), node)
+
+                if stack and types[stack[-1][1]] in (CODE_MUL, CODE_DIV):
+                    left, op_idx = stack.pop()
+                    node = BinOpNode(left, token(op_idx), node)
+                if types[idx] in (CODE_MUL, CODE_DIV): break
+
+                if stack and stack[-1][0] is not None:
+                    left, op_idx = stack.pop()
+                    node = BinOpNode(left, token(op_idx), node)
+                if types[idx] in (CODE_PLUS, CODE_MINUS): break
+
+                if not stack:
+                    self.idx = idx
+                    return node
+
+                if types[idx] != CODE_RPAREN:
+                    raise self.syntax_error(token(idx), "Expected ')'")
+                stack.pop()
+                idx += 1
+
+            stack.append((node, idx))
+            idx += 1
+
+class DagParser(IterativeParser):
+    # IterativeParser whose result is interned into a DAG; the interner
+    # is kept for its info()
+    def __init__(self, tokens, source, interner=None):
+        super().__init__(tokens, source)
+        self.interner = interner or NodeInterner()
+
+    def parse(self):
+        res = super().parse()
+        if res.node is not None: res.node = self.interner.intern(res.node)
+        return res
+
 #######################################
 # RUNTIME RESULT
 #######################################
@@ -382,13 +1119,20 @@ class Number:
         if isinstance(other, Number):
             if other.value == 0:
                 return None, RTError(
-                    other.pos_start, other.pos_end,
+                    self.context.source.pos(other.pos_start), self.context.source.pos(other.pos_end),
                     'Division by zero',
                     self.context
                 )
 
             return Number(self.value / other.value).set_context(self.context), None
 
+    def json_value(self):
+        # The value as strict JSON allows it: infinities and NaN, which have
+        # no JSON literal, become the strings 'inf', '-inf' and 'nan'
+        # (inf - inf and nan - nan are nan, never 0)
+        if self.value.__class__ is float and self.value - self.value != 0: return str(self.value)
+        return self.value
+
     def __repr__(self):
         return str(self.value)
 
@@ -397,10 +1141,110 @@ class Number:
 #######################################
 
 class Context:
-    def __init__(self, display_name, parent=None, parent_entry_pos=None):
+    # limits are what the tree walkers check evaluation against
+    def __init__(self, display_name, parent=None, parent_entry_pos=None, source=None, limits=None):
         self.display_name = display_name
         self.parent = parent
         self.parent_entry_pos = parent_entry_pos
+        self.source = source
+        self.symbol_table = None
+        self.limits = limits or default_limits
+
+#######################################
+# SYMBOL TABLE
+#######################################
+
+class SymbolTable:
+    # Variable values by name, as plain ints and floats
+    def __init__(self):
+        self.symbols = {}
+        self.parent = None
+
+    def get(self, name):
+        value = self.symbols.get(name, None)
+        if value == None and self.parent:
+            return self.parent.get(name)
+        return value
+
+    def set(self, name, value):
+        self.symbols[name] = value
+
+    def remove(self, name):
+        del self.symbols[name]
+
+#######################################
+# LIMITS
+#######################################
+
+class Limits:
+    # Caps on what one expression may cost. parse_text() stops lexing at
+    # the node past max_nodes or an int literal over max_bits bits, and
+    # rejects an AST deeper than max_depth. Every evaluator rejects a
+    # product of ints over max_bits bits before computing it. Each comes
+    # back as an RTError spanning the offending part; float('inf')
+    # disables a limit.
+    #
+    # The defaults suit run() on untrusted one-line formulas: up to 10000
+    # nodes, any depth (trees too deep for the tree walkers run on the
+    # bytecode VM instead) and 8192-bit ints. run_file lifts max_nodes.
+    # parse_cache keys entries by key(), so changed limits never reuse
+    # what was checked against others
+    def __init__(self, max_nodes=10000, max_depth=float('inf'), max_bits=8192):
+        self.max_nodes = max_nodes
+        self.max_depth = max_depth
+        self.max_bits = max_bits
+
+    def key(self):
+        return self.max_nodes, self.max_depth, self.max_bits
+
+    def too_deep(self, node):
+        # The first node (in pre-order) more than max_depth levels down, or
+        # None. Subtree heights come from one post-order pass; the path down
+        # from the root then takes the leftmost child that is tall enough
+        heights = {}
+        for current in postorder(node):
+            if isinstance(current, BinOpNode):
+                height = max(heights[id(current.left_node)], heights[id(current.right_node)]) + 1
+            elif isinstance(current, UnaryOpNode):
+                height = heights[id(current.node)] + 1
+            else:
+                height = 1
+            heights[id(current)] = height
+
+        if heights[id(node)] <= self.max_depth: return None
+
+        depth = 1
+        while depth <= self.max_depth:
+            if isinstance(node, BinOpNode):
+                left = node.left_node
+                node = left if depth + heights[id(left)] > self.max_depth else node.right_node
+            else:
+                node = node.node
+            depth += 1
+
+        return node
+
+# Used wherever no other limits are passed; tune its attributes in place
+default_limits = Limits()
+
+def limit_exceeded(source, pos_start, pos_end, details):
+    # The RTError for a limit hit while lexing or parsing
+    return RTError(
+        source.pos(pos_start), source.pos(pos_end),
+        details,
+        Context('<program>', source=source)
+    )
+
+def exceeds_bits(left, right, max_bits):
+    # True if left * right has more than max_bits bits, decided without
+    # multiplying unless the answer hangs on the last bit
+    if left.__class__ is not int or right.__class__ is not int: return False
+
+    bits = left.bit_length() + right.bit_length()
+    if bits <= max_bits or not left or not right: return False
+
+    # A product of nonzero ints has bits or bits - 1 bits
+    return bits - 1 > max_bits or (left * right).bit_length() > max_bits
 
 #######################################
 # INTERPRETER
@@ -422,6 +1266,22 @@ class Interpreter:
             Number(node.tok.value).set_context(context).set_pos(node.pos_start, node.pos_end)
         )
 
+    def visit_VarAccessNode(self, node, context):
+        res = RTResult()
+        var_name = node.var_name_tok.value
+        value = context.symbol_table.get(var_name)
+
+        if value is None:
+            return res.failure(RTError(
+                context.source.pos(node.pos_start), context.source.pos(node.pos_end),
+                f"'{var_name}' is not defined",
+                context
+            ))
+
+        return res.success(
+            Number(value).set_context(context).set_pos(node.pos_start, node.pos_end)
+        )
+
     def visit_BinOpNode(self, node, context):
         res = RTResult()
         left = res.register(self.visit(node.left_node, context))
@@ -429,14 +1289,19 @@ class Interpreter:
         right = res.register(self.visit(node.right_node, context))
         if res.error: return res
 
-        if node.op_tok.type == TT_PLUS:
-            result, error = left.added_to(right)
-        elif node.op_tok.type == TT_MINUS:
-            result, error = left.subbed_by(right)
-        elif node.op_tok.type == TT_MUL:
-            result, error = left.multed_by(right)
-        elif node.op_tok.type == TT_DIV:
-            result, error = left.dived_by(right)
+        try:
+            if node.op_tok.type == TT_PLUS:
+                result, error = left.added_to(right)
+            elif node.op_tok.type == TT_MINUS:
+                result, error = left.subbed_by(right)
+            elif node.op_tok.type == TT_MUL:
+                if exceeds_bits(left.value, right.value, context.limits.max_bits):
+                    return res.failure(product_too_large(node.pos_start, node.pos_end, context, context.limits.max_bits).error)
+                result, error = left.multed_by(right)
+            elif node.op_tok.type == TT_DIV:
+                result, error = left.dived_by(right)
+        except OverflowError:
+            return res.failure(float_overflow(node.pos_start, node.pos_end, context).error)
 
         if error:
             return res.failure(error)
@@ -458,24 +1323,947 @@ class Interpreter:
         else:
             return res.success(number.set_pos(node.pos_start, node.pos_end))
 
+class UnboxedInterpreter:
+    # Same results as Interpreter, computed on raw ints and floats. Nothing
+    # is allocated per node and divisors are not checked: a zero divisor
+    # surfaces as ZeroDivisionError (and a result out of float range as
+    # OverflowError), and only then is the tree walked again with checks to
+    # build the RTError Interpreter would have returned
+    def visit(self, node, context):
+        res = RTResult()
+
+        try:
+            value = self.value_of(node, context)
+        except (ZeroDivisionError, OverflowError):
+            try:
+                self.checked_value_of(node, context)
+            except EvalError as e:
+                return res.failure(e.error)
+            raise
+        except EvalError as e:
+            return res.failure(e.error)
+
+        return res.success(
+            Number(value).set_context(context).set_pos(node.pos_start, node.pos_end)
+        )
+
+    def value_of(self, node, context):
+        if node.__class__ is NumberNode:
+            return node.tok.value
+
+        if node.__class__ is BinOpNode:
+            left = self.value_of(node.left_node, context)
+            right = self.value_of(node.right_node, context)
+            op = node.op_tok.type
+
+            if op == TT_PLUS: return left + right
+            if op == TT_MINUS: return left - right
+            if op == TT_MUL:
+                if exceeds_bits(left, right, context.limits.max_bits):
+                    raise product_too_large(node.pos_start, node.pos_end, context, context.limits.max_bits)
+                return left * right
+            return left / right
+
+        if node.__class__ is VarAccessNode:
+            return load_name(node, context)
+
+        # Same arithmetic as Interpreter's multed_by(Number(-1)); every backend
+        # negates this way
+        if node.op_tok.type == TT_MINUS: return self.value_of(node.node, context) * -1
+        return self.value_of(node.node, context)
+
+    def checked_value_of(self, node, context):
+        # value_of with the divisor and overflow checks; raises EvalError at
+        # the first zero divisor or overflow in evaluation order
+        if node.__class__ is NumberNode:
+            return node.tok.value
+
+        if node.__class__ is BinOpNode:
+            left = self.checked_value_of(node.left_node, context)
+            right = self.checked_value_of(node.right_node, context)
+            op = node.op_tok.type
+
+            try:
+                if op == TT_PLUS: return left + right
+                if op == TT_MINUS: return left - right
+                if op == TT_MUL:
+                    if exceeds_bits(left, right, context.limits.max_bits):
+                        raise product_too_large(node.pos_start, node.pos_end, context, context.limits.max_bits)
+                    return left * right
+                if right == 0:
+                    raise division_by_zero(node.right_node.pos_start, node.right_node.pos_end, context)
+                return left / right
+            except OverflowError:
+                raise float_overflow(node.pos_start, node.pos_end, context)
+
+        if node.__class__ is VarAccessNode:
+            return load_name(node, context)
+
+        if node.op_tok.type == TT_MINUS: return self.checked_value_of(node.node, context) * -1
+        return self.checked_value_of(node.node, context)
+
+class DagInterpreter:
+    # Evaluates a DAG from DagParser computing each shared node once, on
+    # raw values like UnboxedInterpreter. Shared nodes do not know where
+    # their other occurrences are, so on a runtime error the text is parsed
+    # again without interning and the tree gives the exact RTError (through
+    # the bytecode VM, which has no depth limit either)
+    def visit(self, node, context):
+        res = RTResult()
+
+        try:
+            value = self.value_of(node, context)
+        except (ZeroDivisionError, OverflowError, EvalError):
+            _, tree, _ = parse_text(context.source.fn, context.source.text, context.limits)
+            return BytecodeCompiler().compile(tree, context.limits).evaluate(context)
+
+        return res.success(
+            Number(value).set_context(context).set_pos(node.pos_start, node.pos_end)
+        )
+
+    def value_of(self, node, context):
+        # Each shared node once, in post-order, keyed by node identity
+        values = {}
+        max_bits = context.limits.max_bits
+
+        for current in postorder(node, values):
+            key = id(current)
+
+            if current.__class__ is NumberNode:
+                values[key] = current.tok.value
+            elif current.__class__ is VarAccessNode:
+                values[key] = load_name(current, context)
+
+            elif current.__class__ is BinOpNode:
+                left = values[id(current.left_node)]
+                right = values[id(current.right_node)]
+                op = current.op_tok.type
+
+                if op == TT_PLUS: values[key] = left + right
+                elif op == TT_MINUS: values[key] = left - right
+                elif op == TT_MUL:
+                    if exceeds_bits(left, right, max_bits):
+                        raise product_too_large(current.pos_start, current.pos_end, context, max_bits)
+                    values[key] = left * right
+                else: values[key] = left / right
+
+            elif current.op_tok.type == TT_MINUS:
+                values[key] = values[id(current.node)] * -1
+            else:
+                values[key] = values[id(current.node)]
+
+        return values[id(node)]
+
+#######################################
+# CLOSURE COMPILER
+#######################################
+
+class Compiled:
+    # An AST compiled to func(context) -> raw value under limits. func
+    # raises EvalError on a runtime error; evaluate() wraps both the way
+    # Interpreter does. A result out of float range surfaces as a bare
+    # OverflowError, so the expression is run again on the bytecode VM to
+    # find the node it came from
+    def __init__(self, node, func, limits):
+        self.node = node
+        self.func = func
+        self.limits = limits
+
+    def evaluate(self, context):
+        res = RTResult()
+
+        try:
+            value = self.func(context)
+        except EvalError as e:
+            return res.failure(e.error)
+        except OverflowError:
+            return BytecodeCompiler().compile(self.node, self.limits).evaluate(context)
+
+        return res.success(
+            Number(value).set_context(context).set_pos(self.node.pos_start, self.node.pos_end)
+        )
+
+    def __repr__(self):
+        return f'<compiled {self.node}>'
+
+def division_by_zero(pos_start, pos_end, context):
+    # The RTError Number.dived_by gives for a zero divisor spanning pos_start:pos_end
+    return EvalError(RTError(
+        context.source.pos(pos_start), context.source.pos(pos_end),
+        'Division by zero',
+        context
+    ))
+
+def product_too_large(pos_start, pos_end, context, max_bits):
+    # The RTError for a product over max_bits bits spanning pos_start:pos_end
+    return EvalError(RTError(
+        context.source.pos(pos_start), context.source.pos(pos_end),
+        f'Result exceeds {max_bits} bits',
+        context
+    ))
+
+def float_overflow(pos_start, pos_end, context):
+    # The RTError for a result out of float range spanning pos_start:pos_end:
+    # an int too large for a float met a float, or an int quotient was
+    return EvalError(RTError(
+        context.source.pos(pos_start), context.source.pos(pos_end),
+        'Result too large for a float',
+        context
+    ))
+
+def name_not_defined(var_name, pos_start, pos_end, context):
+    # The RTError Interpreter gives for an unbound name spanning pos_start:pos_end
+    return EvalError(RTError(
+        context.source.pos(pos_start), context.source.pos(pos_end),
+        f"'{var_name}' is not defined",
+        context
+    ))
+
+def load_name(node, context):
+    # The variable's raw value; raises EvalError if it is unbound
+    value = context.symbol_table.get(node.var_name_tok.value)
+    if value is None: raise name_not_defined(node.var_name_tok.value, node.pos_start, node.pos_end, context)
+    return value
+
+class ClosureCompiler:
+    # Turns an AST into nested closures once, with each operator already
+    # chosen, so evaluating skips visit dispatch and the RTResult/Number
+    # wrappers on every node. Like every compiler here, the result checks
+    # the limits it was compiled under rather than the context's
+    def compile(self, node, limits=None):
+        limits = limits or default_limits
+        self.max_bits = limits.max_bits
+        return Compiled(node, self.visit(node), limits)
+
+    def visit(self, node):
+        method_name = f'compile_{type(node).__name__}'
+        method = getattr(self, method_name, self.no_visit_method)
+        return method(node)
+
+    def no_visit_method(self, node):
+        raise Exception(f'No compile_{type(node).__name__} method defined')
+
+    ###################################
+
+    def compile_NumberNode(self, node):
+        value = node.tok.value
+        return lambda context: value
+
+    def compile_VarAccessNode(self, node):
+        return lambda context: load_name(node, context)
+
+    def compile_BinOpNode(self, node):
+        left = self.visit(node.left_node)
+        right = self.visit(node.right_node)
+
+        if node.op_tok.type == TT_PLUS:
+            return lambda context: left(context) + right(context)
+        elif node.op_tok.type == TT_MINUS:
+            return lambda context: left(context) - right(context)
+        elif node.op_tok.type == TT_MUL:
+            max_bits = self.max_bits
+
+            def multiply(context):
+                multiplicand = left(context)
+                multiplier = right(context)
+                if exceeds_bits(multiplicand, multiplier, max_bits):
+                    raise product_too_large(node.pos_start, node.pos_end, context, max_bits)
+                return multiplicand * multiplier
+
+            return multiply
+        elif node.op_tok.type == TT_DIV:
+            right_node = node.right_node
+
+            def divide(context):
+                dividend = left(context)
+                divisor = right(context)
+                if divisor == 0: raise division_by_zero(right_node.pos_start, right_node.pos_end, context)
+                return dividend / divisor
+
+            return divide
+
+    def compile_UnaryOpNode(self, node):
+        operand = self.visit(node.node)
+
+        if node.op_tok.type == TT_MINUS:
+            return lambda context: operand(context) * -1
+
+        return operand
+
+#######################################
+# PYTHON COMPILER
+#######################################
+
+class PythonCompiler:
+    # Translates an AST into `lambda context: <expr>` as a Python ast and
+    # compiles it, so CPython's own evaluator does the arithmetic. Divisions
+    # go through a guarded div() that raises the same RTError as Interpreter,
+    # and variables through load(). Products only go through the guarded
+    # mul() when the static bound on their size can pass max_bits
+    PY_OPS = {TT_PLUS: 'Add', TT_MINUS: 'Sub', TT_MUL: 'Mult'}
+
+    def compile(self, node, limits=None):
+        limits = limits or default_limits
+        self.max_bits = max_bits = limits.max_bits
+        self.divisors = []
+        self.names = []
+        self.products = []
+        self.bits = {}
+        body = self.visit(node)
+        divisors = tuple(self.divisors)
+        names = tuple(self.names)
+        products = tuple(self.products)
+
+        def div(dividend, divisor, idx, context):
+            if divisor == 0: raise division_by_zero(*divisors[idx], context)
+            return dividend / divisor
+
+        def mul(multiplicand, multiplier, idx, context):
+            if exceeds_bits(multiplicand, multiplier, max_bits): raise product_too_large(*products[idx], context, max_bits)
+            return multiplicand * multiplier
+
+        def load(idx, context):
+            return load_name(names[idx], context)
+
+        args = py_ast.arguments(
+            posonlyargs=[], args=[py_ast.arg('context')], kwonlyargs=[],
+            kw_defaults=[], defaults=[]
+        )
+        tree = py_ast.fix_missing_locations(py_ast.Expression(py_ast.Lambda(args, body)))
+        code = compile(tree, '<legacy>', 'eval')
+
+        return Compiled(node, eval(code, {'div': div, 'mul': mul, 'load': load}), limits)
+
+    def visit(self, node):
+        method_name = f'compile_{type(node).__name__}'
+        method = getattr(self, method_name, self.no_visit_method)
+        return method(node)
+
+    def no_visit_method(self, node):
+        raise Exception(f'No compile_{type(node).__name__} method defined')
+
+    ###################################
+
+    # self.bits maps each node to an upper bound on its bit length if it is
+    # an int (0 if it is a float) or None if that depends on variables
+
+    def compile_NumberNode(self, node):
+        value = node.tok.value
+        self.bits[node] = value.bit_length() if isinstance(value, int) else 0
+        return py_ast.Constant(value)
+
+    def compile_VarAccessNode(self, node):
+        self.bits[node] = None
+        self.names.append(node)
+        return py_ast.Call(
+            py_ast.Name('load', py_ast.Load()),
+            [py_ast.Constant(len(self.names) - 1), py_ast.Name('context', py_ast.Load())],
+            []
+        )
+
+    def compile_BinOpNode(self, node):
+        left = self.visit(node.left_node)
+        right = self.visit(node.right_node)
+        left_bits = self.bits[node.left_node]
+        right_bits = self.bits[node.right_node]
+
+        if node.op_tok.type == TT_DIV:
+            self.bits[node] = 0
+            self.divisors.append((node.right_node.pos_start, node.right_node.pos_end))
+            return py_ast.Call(
+                py_ast.Name('div', py_ast.Load()),
+                [left, right, py_ast.Constant(len(self.divisors) - 1), py_ast.Name('context', py_ast.Load())],
+                []
+            )
+
+        if node.op_tok.type == TT_MUL:
+            # A float or a zero on either side keeps the product from growing
+            if left_bits == 0 or right_bits == 0: bits = 0
+            elif left_bits is None or right_bits is None: bits = None
+            else: bits = left_bits + right_bits
+            self.bits[node] = bits
+
+            if bits is None or bits > self.max_bits:
+                self.products.append((node.pos_start, node.pos_end))
+                return py_ast.Call(
+                    py_ast.Name('mul', py_ast.Load()),
+                    [left, right, py_ast.Constant(len(self.products) - 1), py_ast.Name('context', py_ast.Load())],
+                    []
+                )
+        elif left_bits is None or right_bits is None:
+            self.bits[node] = None
+        else:
+            self.bits[node] = max(left_bits, right_bits) + 1
+
+        return py_ast.BinOp(left, getattr(py_ast, self.PY_OPS[node.op_tok.type])(), right)
+
+    def compile_UnaryOpNode(self, node):
+        operand = self.visit(node.node)
+        self.bits[node] = self.bits[node.node]
+
+        if node.op_tok.type == TT_MINUS:
+            return py_ast.BinOp(operand, py_ast.Mult(), py_ast.Constant(-1))
+
+        return operand
+
+#######################################
+# BYTECODE
+#######################################
+
+OP_PUSH_CONST = 0
+OP_ADD        = 1
+OP_SUB        = 2
+OP_MUL        = 3
+OP_DIV        = 4
+OP_NEG        = 5
+OP_RETURN     = 6
+OP_LOAD_NAME  = 7
+
+OP_NAMES = ('PUSH_CONST', 'ADD', 'SUB', 'MUL', 'DIV', 'NEG', 'RETURN', 'LOAD_NAME')
+BINARY_OPS = {TT_PLUS: OP_ADD, TT_MINUS: OP_SUB, TT_MUL: OP_MUL, TT_DIV: OP_DIV}
+
+class Bytecode:
+    # Flat stack-machine program. code holds (opcode, arg) word pairs, arg
+    # being a constant index for PUSH_CONST, a names index for LOAD_NAME,
+    # the divisor's start for DIV (it ends where the division does) and 0
+    # otherwise. starts/ends give each instruction's source span, and
+    # pos_start/pos_end the whole expression's. All
+    # three are 8-byte arrays, so dumps() output loads on any platform.
+    # max_bits is the product limit it was compiled under
+    def __init__(self, code, consts, names, starts, ends, pos_start, pos_end, max_bits):
+        self.code = code
+        self.consts = consts
+        self.names = names
+        self.starts = starts
+        self.ends = ends
+        self.pos_start = pos_start
+        self.pos_end = pos_end
+        self.max_bits = max_bits
+
+    def run(self, context):
+        # Returns the raw value; raises EvalError on a runtime error
+        code, consts, names, max_bits = self.code, self.consts, self.names, self.max_bits
+        stack = []
+        push, pop = stack.append, stack.pop
+
+        # Opcodes as locals, in the order they are tested
+        PUSH_CONST, LOAD_NAME, ADD, SUB, MUL, DIV, NEG = (
+            OP_PUSH_CONST, OP_LOAD_NAME, OP_ADD, OP_SUB, OP_MUL, OP_DIV, OP_NEG
+        )
+
+        try:
+            for pc in range(0, len(code), 2):
+                op = code[pc]
+
+                if op == PUSH_CONST:
+                    push(consts[code[pc + 1]])
+                elif op == LOAD_NAME:
+                    name = names[code[pc + 1]]
+                    value = context.symbol_table.get(name)
+                    if value is None:
+                        idx = pc // 2
+                        raise name_not_defined(name, self.starts[idx], self.ends[idx], context)
+                    push(value)
+                elif op == ADD:
+                    right = pop()
+                    push(pop() + right)
+                elif op == SUB:
+                    right = pop()
+                    push(pop() - right)
+                elif op == MUL:
+                    right = pop()
+                    left = pop()
+                    if exceeds_bits(left, right, max_bits):
+                        idx = pc // 2
+                        raise product_too_large(self.starts[idx], self.ends[idx], context, max_bits)
+                    push(left * right)
+                elif op == DIV:
+                    right = pop()
+                    if right == 0:
+                        raise division_by_zero(code[pc + 1], self.ends[pc // 2], context)
+                    push(pop() / right)
+                elif op == NEG:
+                    push(pop() * -1)
+                else:
+                    return pop()
+        except OverflowError:
+            # Only ADD, SUB, MUL and DIV can overflow, each spanning its node
+            idx = pc // 2
+            raise float_overflow(self.starts[idx], self.ends[idx], context)
+
+    def evaluate(self, context):
+        res = RTResult()
+
+        try:
+            value = self.run(context)
+        except EvalError as e:
+            return res.failure(e.error)
+
+        return res.success(
+            Number(value).set_context(context).set_pos(self.pos_start, self.pos_end)
+        )
+
+    def dis(self):
+        # One line per instruction: source span, offset, opcode, argument
+        lines = []
+
+        for pc in range(0, len(self.code), 2):
+            op, arg = self.code[pc], self.code[pc + 1]
+            idx = pc // 2
+            line = f'{self.starts[idx]:>6}:{self.ends[idx]:<6} {pc:>6} {OP_NAMES[op]:<12}'
+            if op == OP_PUSH_CONST: line += f'{arg:>4} ({self.consts[arg]!r})'
+            elif op == OP_LOAD_NAME: line += f'{arg:>4} ({self.names[arg]})'
+            elif op == OP_DIV: line += f'{arg:>4} (divisor start)'
+            lines.append(line.rstrip())
+
+        return '\n'.join(lines)
+
+    def dumps(self):
+        return marshal.dumps((
+            self.code.tobytes(), self.consts, self.names, self.starts.tobytes(), self.ends.tobytes(),
+            self.pos_start, self.pos_end, self.max_bits
+        ))
+
+    @staticmethod
+    def loads(data):
+        code, consts, names, starts, ends, pos_start, pos_end, max_bits = marshal.loads(data)
+        return Bytecode(
+            array.array('q', code), consts, names, array.array('q', starts), array.array('q', ends),
+            pos_start, pos_end, max_bits
+        )
+
+    def __repr__(self):
+        return f'<bytecode {len(self.code) // 2} instructions, {len(self.consts)} consts>'
+
+class BytecodeCompiler:
+    # Emits Bytecode from an AST in one post-order pass over an explicit
+    # stack, so neither compiling nor running has a depth limit
+    def compile(self, node, limits=None):
+        code = array.array('q')
+        starts = array.array('q')
+        ends = array.array('q')
+        consts = []
+        const_idx = {}
+        names = []
+        name_idx = {}
+
+        def emit(op, arg, pos_start, pos_end):
+            code.append(op)
+            code.append(arg)
+            starts.append(pos_start)
+            ends.append(pos_end)
+
+        for current in postorder(node):
+            if isinstance(current, NumberNode):
+                value = current.tok.value
+                key = (type(value), value)
+                if key not in const_idx:
+                    const_idx[key] = len(consts)
+                    consts.append(value)
+                emit(OP_PUSH_CONST, const_idx[key], current.pos_start, current.pos_end)
+
+            elif isinstance(current, VarAccessNode):
+                name = current.var_name_tok.value
+                if name not in name_idx:
+                    name_idx[name] = len(names)
+                    names.append(name)
+                emit(OP_LOAD_NAME, name_idx[name], current.pos_start, current.pos_end)
+
+            elif isinstance(current, BinOpNode):
+                op = BINARY_OPS[current.op_tok.type]
+                arg = current.right_node.pos_start if op == OP_DIV else 0
+                emit(op, arg, current.pos_start, current.pos_end)
+
+            elif isinstance(current, UnaryOpNode):
+                if current.op_tok.type == TT_MINUS:
+                    emit(OP_NEG, 0, current.pos_start, current.pos_end)
+
+            else:
+                raise Exception(f'No bytecode for {type(current).__name__}')
+
+        emit(OP_RETURN, 0, node.pos_start, node.pos_end)
+        return Bytecode(
+            code, tuple(consts), tuple(names), starts, ends,
+            node.pos_start, node.pos_end, (limits or default_limits).max_bits
+        )
+
+#######################################
+# PARSE CACHE
+#######################################
+
+class CacheEntry:
+    # One parse_text() result plus the tiering state of its expression.
+    # limits is a copy of those it was checked against, which it is also
+    # evaluated and compiled under
+    __slots__ = ('source', 'node', 'error', 'limits', 'runs', 'compiled')
+
+    def __init__(self, source, node, error, limits):
+        self.source = source
+        self.node = node
+        self.error = error
+        self.limits = limits
+        self.runs = 0
+        self.compiled = None
+
+CacheInfo = LazyNamedTuple('CacheInfo', ['hits', 'misses', 'evictions', 'maxsize', 'currsize'])
+
+class ParseCache:
+    # LRU cache of parse_text() results keyed by source text and the key()
+    # of the limits it was parsed under. Nodes only hold offsets, so a hit
+    # under another fn just needs a fresh Source.
+    # Safe to share between threads: the lock covers the table and its
+    # counters but not parsing, so threads missing at once parse in
+    # parallel and the first to finish is kept
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = _thread.allocate_lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, fn, text, limits=None):
+        # Returns (entry, source, error) with source and error bound to fn.
+        # Buffers from run_file are neither hashable nor worth keeping as
+        # keys, so they get an entry that is never stored
+        limits_key = (limits or default_limits).key()
+
+        if not isinstance(text, str):
+            entry = CacheEntry(*parse_text(fn, text, limits), Limits(*limits_key))
+            return entry, entry.source, entry.error
+
+        key = (text, limits_key)
+        with self.lock: entry = self.get(key)
+
+        if entry is None:
+            entry = CacheEntry(*parse_text(fn, text, limits), Limits(*limits_key))
+            if self.maxsize > 0:
+                with self.lock: entry = self.put(key, entry)
+
+        return self.bind(entry, fn, text)
+
+    def lookup_many(self, fn, texts, limits=None):
+        # lookup() for each of a list of texts, taking the lock once for all
+        # their hits and once for all their misses
+        limits_key = (limits or default_limits).key()
+
+        with self.lock:
+            entries = [self.get((text, limits_key)) if isinstance(text, str) else None for text in texts]
+
+        missed = []
+        for idx, entry in enumerate(entries):
+            if entry is None:
+                entries[idx] = CacheEntry(*parse_text(fn, texts[idx], limits), Limits(*limits_key))
+                if isinstance(texts[idx], str): missed.append(idx)
+        if missed and self.maxsize > 0:
+            with self.lock:
+                for idx in missed: entries[idx] = self.put((texts[idx], limits_key), entries[idx])
+
+        return [self.bind(entry, fn, text) for entry, text in zip(entries, texts)]
+
+    def get(self, key):
+        # The entry for key or None, counted as a hit or miss; needs the lock
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        # Stores entry unless another thread stored one for key first, and
+        # returns the one kept; needs the lock
+        entry = self.entries.setdefault(key, entry)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return entry
+
+    def bind(self, entry, fn, text):
+        if entry.source.fn == fn: return entry, entry.source, entry.error
+
+        source = Source(fn, text)
+        source.line_starts = entry.source.line_starts
+        return entry, source, entry.error.rebind(source) if entry.error else None
+
+    def parse(self, fn, text, limits=None):
+        entry, source, error = self.lookup(fn, text, limits)
+        return source, entry.node, error
+
+    def info(self):
+        with self.lock:
+            return CacheInfo(self.hits, self.misses, self.evictions, self.maxsize, len(self.entries))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+# Used by run(); set parse_cache.maxsize to resize, 0 disables caching
+parse_cache = ParseCache()
+
+#######################################
+# TIERED EXECUTION
+#######################################
+
+TierInfo = LazyNamedTuple('TierInfo', [
+    'promotions', 'interpreted_runs', 'interpreted_time',
+    'compiled_runs', 'compiled_time', 'compile_time'
+])
+Promotion = LazyNamedTuple('Promotion', ['text', 'runs', 'compile_time'])
+
+class ThreadMarker:
+    # Stands for a thread in TieredRunner.thread_counters: kept only in
+    # the thread's local storage, so a weak reference to it ends with it
+    __slots__ = ('__weakref__',)
+
+class TieredRunner:
+    # Runs cached expressions on the Interpreter (or any object with the
+    # same visit()) and, once one has run more than `threshold` times,
+    # compiles it and runs the compiled form from then on. Times are in
+    # seconds; the last promotions are kept in promotion_log and also
+    # passed to on_promote if set.
+    #
+    # Safe to share between threads as long as each passes its own Context.
+    # Run counts and times are kept per thread and summed by info(), so
+    # runs never write to the same counter; a thread's counts are folded
+    # into `retired` once it has exited. Compiling, which PythonCompiler
+    # does not allow twice at once, happens under the lock.
+    #
+    # A tree too deep for the interpreter's or compiler's recursion goes to
+    # the bytecode VM, which has no depth limit. iter_run() works through
+    # its texts chunk_size at a time
+    def __init__(self, cache, threshold=16, compiler=None, interpreter=None, on_promote=None, log_size=1000, chunk_size=256):
+        self.cache = cache
+        self.threshold = threshold
+        self.chunk_size = chunk_size
+        self.compiler = compiler or PythonCompiler()
+        self.interpreter = interpreter or Interpreter()
+        self.on_promote = on_promote
+        self.promotion_log = deque(maxlen=log_size)
+        self.lock = _thread.allocate_lock()
+        self.local = _thread._local()
+        self.thread_counters = {}
+        self.exited = deque()
+        self.retired = [0, 0.0, 0, 0.0]
+        self.reset()
+
+    def run(self, fn, text, context=None, limits=None):
+        entry, source, error = self.cache.lookup(fn, text, limits)
+        if error: return None, error
+
+        if context is None:
+            context = Context('<program>')
+            context.symbol_table = global_symbol_table
+        context.source = source
+
+        try: counters = self.local.counters
+        except AttributeError: counters = self.add_counters()
+
+        value, error, _ = self.evaluate(entry, text, context, counters, time.perf_counter())
+        return value, error
+
+    def iter_run(self, fn, texts, context, limits=None):
+        # run() for each text, with the per-call work done once per batch or
+        # per chunk of chunk_size texts: one cache lock for a chunk's
+        # lookups, and one clock reading per text, as each run's end is the
+        # next one's start. A chunk's results are yielded once it has run
+        try: counters = self.local.counters
+        except AttributeError: counters = self.add_counters()
+
+        texts = iter(texts)
+        while True:
+            chunk = list(itertools.islice(texts, self.chunk_size))
+            if not chunk: return
+
+            results = []
+            end = time.perf_counter()
+            for text, (entry, source, error) in zip(chunk, self.cache.lookup_many(fn, chunk, limits)):
+                if error:
+                    results.append((None, error))
+                    continue
+                context.source = source
+                value, error, end = self.evaluate(entry, text, context, counters, end)
+                results.append((value, error))
+
+            yield from results
+
+    def evaluate(self, entry, text, context, counters, start):
+        # Runs a looked-up entry on its tier and adds the run to counters,
+        # timed from the clock reading start (or from after its promotion).
+        # Returns (value, error, the clock reading at the end)
+        context.limits = entry.limits
+
+        # Threads may lose an increment here, which only delays promotion
+        entry.runs += 1
+        if entry.compiled is None and entry.runs > self.threshold:
+            self.promote(entry, text)
+            start = time.perf_counter()
+
+        if entry.compiled is None:
+            try:
+                result = self.interpreter.visit(entry.node, context)
+            except RecursionError:
+                entry.compiled = BytecodeCompiler().compile(entry.node, entry.limits)
+            else:
+                end = time.perf_counter()
+                counters[0] += 1
+                counters[1] += end - start
+                return result.value, result.error, end
+
+        result = entry.compiled.evaluate(context)
+        end = time.perf_counter()
+        counters[2] += 1
+        counters[3] += end - start
+        return result.value, result.error, end
+
+    def add_counters(self):
+        # Gives this thread its [interpreted runs, time, compiled runs, time].
+        # They are registered under a weak reference to a marker that only
+        # this thread's local storage holds, which dies with the thread and
+        # queues the reference in exited
+        marker = self.local.marker = ThreadMarker()
+        counters = self.local.counters = [0, 0.0, 0, 0.0]
+        with self.lock:
+            self.retire_exited()
+            self.thread_counters[_weakref.ref(marker, self.exited.append)] = counters
+        return counters
+
+    def retire_exited(self):
+        # Folds the counts of exited threads into retired; needs the lock.
+        # The weakref callbacks only append to exited, as they may run
+        # while this thread holds the lock
+        while self.exited:
+            counters = self.thread_counters.pop(self.exited.popleft())
+            for idx, count in enumerate(counters): self.retired[idx] += count
+
+    def promote(self, entry, text):
+        with self.lock:
+            # Another thread may have compiled it while this one waited
+            if entry.compiled is not None: return
+
+            start = time.perf_counter()
+            try:
+                entry.compiled = self.compiler.compile(entry.node, entry.limits)
+            except RecursionError:
+                entry.compiled = BytecodeCompiler().compile(entry.node, entry.limits)
+            elapsed = time.perf_counter() - start
+
+            self.promotions += 1
+            self.compile_time += elapsed
+            event = Promotion(text, entry.runs, elapsed)
+            self.promotion_log.append(event)
+
+        if self.on_promote: self.on_promote(event)
+
+    def info(self):
+        with self.lock:
+            self.retire_exited()
+            interpreted_runs, interpreted_time, compiled_runs, compiled_time = (
+                sum(column) for column in zip(self.retired, *self.thread_counters.values())
+            )
+            return TierInfo(
+                self.promotions, interpreted_runs, interpreted_time,
+                compiled_runs, compiled_time, self.compile_time
+            )
+
+    def reset(self):
+        # Counts from runs still in progress on other threads may survive
+        with self.lock:
+            self.promotions = 0
+            self.compile_time = 0.0
+            self.retire_exited()
+            self.retired = [0, 0.0, 0, 0.0]
+            for counters in self.thread_counters.values(): counters[:] = [0, 0.0, 0, 0.0]
+            self.promotion_log.clear()
+
+# Used by run(); tune tiered_runner.threshold, float('inf') never promotes
+tiered_runner = TieredRunner(parse_cache)
+
 #######################################
 # RUN
 #######################################
 
-def run(fn, text):
-    # Generate tokens
-    lexer = Lexer(fn, text)
-    tokens, error = lexer.make_tokens()
-    if error: return None, error
+global_symbol_table = SymbolTable()
+
+def parse_text(fn, text, limits=None):
+    # Checks text against limits (default_limits if None) as it goes
+    limits = limits or default_limits
+
+    # Generate tokens on demand
+    lexer = Lexer(fn, text, limits)
+    tokens = lexer.iter_tokens()
     
     # Generate AST
-    parser = Parser(tokens)
+    parser = IterativeParser(tokens, lexer.source)
     ast = parser.parse()
-    if ast.error: return None, ast.error
 
-    # Run program
-    interpreter = Interpreter()
+    # An illegal character anywhere in the text is reported ahead of any
+    # syntax error, as if the whole text had been lexed up front
+    if ast.error:
+        for _ in tokens: pass
+    if lexer.error: return lexer.source, None, lexer.error
+    if ast.error: return lexer.source, None, ast.error
+
+    # Depth is at most the node count, so small expressions skip the walk
+    if lexer.nodes > limits.max_depth:
+        node = limits.too_deep(ast.node)
+        if node:
+            return lexer.source, None, limit_exceeded(
+                lexer.source, node.pos_start, node.pos_end,
+                f'Expression nesting exceeds depth {limits.max_depth}'
+            )
+
+    return lexer.source, ast.node, None
+
+def run(fn, text, limits=None):
+    # limits defaults to default_limits, as everywhere that takes them
+    return tiered_runner.run(fn, text, limits=limits)
+
+def iter_run(fn, texts, limits=None):
+    # Streaming form of run_many: yields (value, error) per text, in order,
+    # reading tiered_runner.chunk_size texts ahead. Runtime errors resolve
+    # their positions when raised, so one context can be moved on from
+    # source to source
     context = Context('<program>')
-    result = interpreter.visit(ast.node, context)
-
-    return result.value, result.error
+    context.symbol_table = global_symbol_table
+
+    return tiered_runner.iter_run(fn, texts, context, limits)
+
+def run_many(fn, texts, limits=None):
+    # Evaluates every text with one Interpreter and Context; returns a
+    # list of values and a list of errors, aligned with texts
+    values = []
+    errors = []
+
+    for value, error in iter_run(fn, texts, limits):
+        values.append(value)
+        errors.append(error)
+
+    return values, errors
+
+def run_file(path, limits=None):
+    # Maps the file and lexes straight from the bytes instead of reading and
+    # decoding it into a str first. A single trailing newline is ignored, the
+    # same way input() drops it in the shell. A file is one formula of any
+    # size, so without limits given only max_nodes is lifted from
+    # default_limits
+    if limits is None:
+        limits = Limits(float('inf'), default_limits.max_depth, default_limits.max_bits)
+
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0: return run(path, '', limits)
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    end = size - 1 if buffer[size - 1] == ord('\n') else size
+    view = memoryview(buffer)[:end]
+    result, error = run(path, view, limits)
+
+    # An error still needs the mapping to render, so it is left for the GC
+    if not error:
+        view.release()
+        buffer.close()
+
+    return result, error
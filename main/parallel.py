@@ -0,0 +1,202 @@
+import argparse
+import multiprocessing
+import os
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice, tee
+
+import legacy
+import shell
+
+#######################################
+# CONSTANTS
+#######################################
+
+# Texts per task: enough to amortize pickling one task and its results,
+# few enough that the pool stays balanced near the end of a batch
+CHUNKSIZE = 256
+
+#######################################
+# ERRORS
+#######################################
+
+ERROR_CLASSES = {
+    cls.__name__: cls
+    for cls in (legacy.IllegalCharError, legacy.InvalidSyntaxError, legacy.RTError)
+}
+
+def serialize_error(error):
+    # Errors hold their Source and Context; across processes only the
+    # class, details and offsets are sent, and the text is already here
+    return type(error).__name__, error.details, error.pos_start.idx, error.pos_end.idx
+
+def deserialize_error(data, fn, text):
+    name, details, pos_start, pos_end = data
+    source = legacy.Source(fn, text)
+    error_class = ERROR_CLASSES[name]
+
+    if error_class is legacy.RTError:
+        return error_class(source.pos(pos_start), source.pos(pos_end), details, legacy.Context('<program>', source=source))
+    return error_class(source.pos(pos_start), source.pos(pos_end), details)
+
+#######################################
+# WORKER
+#######################################
+
+def run_chunk(fn, texts):
+    # Runs in a worker: each process keeps its own parse cache and tiered
+    # runner warm across chunks. Returns (raw value, serialized error) pairs
+    results = []
+
+    for value, error in legacy.iter_run(fn, texts):
+        if error: results.append((None, serialize_error(error)))
+        else: results.append((value.value, None))
+
+    return results
+
+def run_chunk_here(fn, texts):
+    # Runs in a thread: results stay in this process, so they need no
+    # serializing and every thread shares the one parse cache and runner
+    return list(legacy.iter_run(fn, texts))
+
+def iter_chunks(submit, texts, chunksize, window):
+    # Yields (chunk, handle) in input order, where handle is what submit()
+    # returned for the chunk; at most `window` chunks are submitted ahead,
+    # so texts may be a stream of any length
+    texts = iter(texts)
+    pending = deque()
+
+    while True:
+        while len(pending) < window:
+            chunk = list(islice(texts, chunksize))
+            if not chunk: break
+            pending.append((chunk, submit(chunk)))
+
+        if not pending: return
+        yield pending.popleft()
+
+#######################################
+# POOL
+#######################################
+
+def pool_context():
+    # A fork server that has already imported this module (and so legacy)
+    # starts each worker as a cheap fork of a warm process. Falls back to
+    # spawn where there is no fork server
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__name__])
+        return context
+
+    return multiprocessing.get_context('spawn')
+
+class BatchPool:
+    # Spreads run() over a pool of worker processes, in chunks of texts.
+    # The workers are started once and reused by every batch; close() (or
+    # leaving a with block) shuts them down
+    def __init__(self, processes=None, chunksize=CHUNKSIZE):
+        self.processes = processes or os.cpu_count()
+        self.chunksize = chunksize
+        self.pool = pool_context().Pool(self.processes)
+
+    def iter_run(self, fn, texts):
+        # Yields (value, error) per text in input order, like legacy.iter_run,
+        # with at most two chunks per worker in flight
+        submit = lambda chunk: self.pool.apply_async(run_chunk, (fn, chunk))
+
+        for chunk, result in iter_chunks(submit, texts, self.chunksize, self.processes * 2):
+            for text, (value, error) in zip(chunk, result.get()):
+                if error: yield None, deserialize_error(error, fn, text)
+                else: yield legacy.Number(value), None
+
+    def run_many(self, fn, texts):
+        # Same result as legacy.run_many: a list of values and a list of
+        # errors, aligned with texts
+        values = []
+        errors = []
+
+        for value, error in self.iter_run(fn, texts):
+            values.append(value)
+            errors.append(error)
+
+        return values, errors
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class ThreadBatchPool(BatchPool):
+    # BatchPool over threads in this process. The lexer, parser, caches
+    # and evaluators are safe to share between threads, so on a
+    # free-threaded build this scales across cores without the cost of
+    # starting processes or pickling results; under the GIL the threads
+    # take turns
+    def __init__(self, threads=None, chunksize=CHUNKSIZE):
+        self.processes = threads or os.cpu_count()
+        self.chunksize = chunksize
+        self.executor = ThreadPoolExecutor(self.processes)
+
+    def iter_run(self, fn, texts):
+        submit = lambda chunk: self.executor.submit(run_chunk_here, fn, chunk)
+
+        for chunk, future in iter_chunks(submit, texts, self.chunksize, self.processes * 2):
+            yield from future.result()
+
+    def close(self):
+        self.executor.shutdown()
+
+#######################################
+# MAIN
+#######################################
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Evaluate a file of expressions, one per line, across processes.')
+    parser.add_argument('path', help="file of expressions, or '-' for stdin")
+    parser.add_argument('-j', '--processes', type=int, default=None, help='workers (default: one per core)')
+    parser.add_argument('--chunksize', type=int, default=CHUNKSIZE, help=f'expressions per task (default: {CHUNKSIZE})')
+    parser.add_argument('--threads', action='store_true', help='use threads instead of processes (for free-threaded builds)')
+    args = parser.parse_args(argv)
+
+    # Like the shell, reads and writes through wrappers of its own, so
+    # neither sys.stdin nor sys.stdout is closed when they are
+    if args.path == '-':
+        f = open(sys.stdin.fileno(), buffering=shell.BUFFER_SIZE, encoding='utf-8', closefd=False)
+        fn = '<stdin>'
+    else:
+        try:
+            f = open(args.path, buffering=shell.BUFFER_SIZE, encoding='utf-8')
+        except OSError as e:
+            parser.error(f"can't open '{args.path}': {e.strerror}")
+        fn = args.path
+    out = open(sys.stdout.fileno(), 'w', buffering=shell.BUFFER_SIZE, encoding='utf-8', closefd=False)
+
+    # The shell's reader: blank lines are skipped, the rest keep their
+    # line numbers for errors
+    lines, numbered = tee(line for chunk in shell.iter_chunks(f) for line in chunk)
+    texts = (text for lineno, text in numbered)
+
+    failed = False
+    pool_class = ThreadBatchPool if args.threads else BatchPool
+    try:
+        with f, out, pool_class(args.processes, args.chunksize) as pool:
+            for (lineno, text), (value, error) in zip(lines, pool.iter_run(fn, texts)):
+                if error:
+                    failed = True
+                    out.write(shell.at_line(fn, lineno, text, error).as_string() + '\n')
+                else:
+                    out.write(f'{value}\n')
+    except BrokenPipeError:
+        # The reader went away (e.g. `| head`); nothing left to report to
+        return 1
+
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,253 @@
+import argparse
+import asyncio
+import json
+import sys
+from collections import deque
+
+import legacy
+
+#######################################
+# CONSTANTS
+#######################################
+
+# Most requests evaluated per batch; bounds how long one batch holds the loop
+BATCH_SIZE = 64
+# Requests queued across all connections before reading stops
+QUEUE_SIZE = 1024
+# Unanswered requests per connection before reading it stops
+PIPELINE_DEPTH = 256
+# Longest request or response line
+LINE_LIMIT = 1 << 20
+
+#######################################
+# SERVER
+#######################################
+
+class EvalServer:
+    # Newline-delimited JSON over TCP or a Unix socket. Each request line
+    # is {"id": ..., "text": ..., "fn": ...} (fn is optional) and gets one
+    # response line, {"id": ..., "value": ...} or {"id": ..., "error": ...}
+    # with the error from Error.as_string(), in request order. Both ways
+    # are strict JSON: infinite and NaN values go out as the strings
+    # 'inf', '-inf' and 'nan', as in the shell's json format.
+    #
+    # Connections may pipeline requests. They all feed one queue, which a
+    # single task drains in batches of up to batch_size, taking whatever
+    # has queued up while the previous batch ran. A full queue stops the
+    # connections from being read, so backpressure reaches clients through
+    # their sockets
+    def __init__(self, batch_size=BATCH_SIZE, queue_size=QUEUE_SIZE, pipeline_depth=PIPELINE_DEPTH):
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.pipeline_depth = pipeline_depth
+        self.server = None
+        self.batcher = None
+        self.connections = {}
+        self.batches = 0
+        self.requests = 0
+
+    async def start(self, host='127.0.0.1', port=0, path=None):
+        # Listens on path if given, otherwise on host:port (port 0 picks one)
+        self.queue = asyncio.Queue(self.queue_size)
+
+        if path: self.server = await asyncio.start_unix_server(self.handle, path, limit=LINE_LIMIT)
+        else: self.server = await asyncio.start_server(self.handle, host, port, limit=LINE_LIMIT)
+
+        self.batcher = asyncio.create_task(self.run_batches())
+        return self
+
+    def address(self):
+        return self.server.sockets[0].getsockname()
+
+    async def serve_forever(self):
+        await self.server.serve_forever()
+
+    async def close(self):
+        # Stops listening, drops open connections and waits for their
+        # handlers to finish
+        self.server.close()
+        for writer in self.connections.values(): writer.transport.abort()
+        await asyncio.gather(*self.connections, return_exceptions=True)
+        self.batcher.cancel()
+        await self.server.wait_closed()
+
+    ###################################
+
+    async def handle(self, reader, writer):
+        # Reads and queues requests; respond() writes the answers back in
+        # order as their futures complete
+        pending = asyncio.Queue(self.pipeline_depth)
+        responder = asyncio.create_task(self.respond(pending, writer))
+        loop = asyncio.get_running_loop()
+        task = asyncio.current_task()
+        self.connections[task] = writer
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line: break
+
+                future = loop.create_future()
+                await pending.put(future)
+                request = self.parse_request(line, future)
+                if request: await self.queue.put(request)
+        except (ValueError, ConnectionError):
+            # ValueError is a line over LINE_LIMIT; the connection is dropped
+            pass
+        finally:
+            await pending.put(None)
+            await responder
+            del self.connections[task]
+
+    def parse_request(self, line, future):
+        # Returns (id, fn, text, future), or None after answering a bad
+        # request, under its id if it got that far
+        request_id = None
+        try:
+            request = json.loads(line, parse_constant=reject_constant)
+            request_id = request.get('id')
+            text = request['text']
+            fn = request.get('fn', '<stdin>')
+            if not isinstance(text, str) or not isinstance(fn, str): raise TypeError('text and fn must be strings')
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            future.set_result({'id': request_id, 'error': f'Bad request: {e!r}'})
+            return None
+
+        return request_id, fn, text, future
+
+    async def respond(self, pending, writer):
+        while True:
+            future = await pending.get()
+            if future is None: break
+
+            response = await future
+            # Once the client is gone answers are dropped, but still awaited
+            # so that handle() can finish
+            if writer.is_closing(): continue
+
+            writer.write(json.dumps(response).encode() + b'\n')
+            # Waits only while the transport is over its high-water mark, so
+            # a client that stops reading stops this connection being read
+            try: await writer.drain()
+            except ConnectionError: writer.close()
+
+        writer.close()
+
+    ###################################
+
+    async def run_batches(self):
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            self.evaluate(batch)
+            self.batches += 1
+            self.requests += len(batch)
+
+            # Let connections read and write before the next batch
+            await asyncio.sleep(0)
+
+    def evaluate(self, batch):
+        # One Context for the whole batch, as in legacy.iter_run
+        context = legacy.Context('<program>')
+        context.symbol_table = legacy.global_symbol_table
+
+        for request_id, fn, text, future in batch:
+            try:
+                value, error = legacy.tiered_runner.run(fn, text, context)
+            except Exception as e:
+                future.set_result({'id': request_id, 'error': f'Internal error: {e!r}'})
+                continue
+
+            if error: future.set_result({'id': request_id, 'error': error.as_string()})
+            else: future.set_result({'id': request_id, 'value': value.json_value()})
+
+def reject_constant(name):
+    # NaN and Infinity are not JSON, and an id holding one could not be sent back
+    raise ValueError(f'{name} is not JSON')
+
+#######################################
+# CLIENT
+#######################################
+
+class EvalClient:
+    # In-process client for EvalServer. evaluate() may be called
+    # concurrently on one connection: requests go out as they are made and
+    # answers are matched back to them in order
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.waiting = deque()
+        self.next_id = 0
+        self.receiver = asyncio.create_task(self.receive())
+
+    @classmethod
+    async def connect(cls, host='127.0.0.1', port=None, path=None):
+        if path: reader, writer = await asyncio.open_unix_connection(path, limit=LINE_LIMIT)
+        else: reader, writer = await asyncio.open_connection(host, port, limit=LINE_LIMIT)
+        return cls(reader, writer)
+
+    async def evaluate(self, text, fn='<stdin>'):
+        # Returns (value, error): a plain number or None, and the rendered
+        # error or None
+        future = asyncio.get_running_loop().create_future()
+        self.waiting.append(future)
+        self.writer.write(json.dumps({'id': self.next_id, 'fn': fn, 'text': text}).encode() + b'\n')
+        self.next_id += 1
+        await self.writer.drain()
+
+        response = await future
+        value = response.get('value')
+        if isinstance(value, str): value = float(value)
+        return value, response.get('error')
+
+    async def evaluate_many(self, texts, fn='<stdin>'):
+        # Pipelines every text; results in input order
+        return await asyncio.gather(*(self.evaluate(text, fn) for text in texts))
+
+    async def receive(self):
+        while True:
+            line = await self.reader.readline()
+            if not line: break
+            self.waiting.popleft().set_result(json.loads(line))
+
+        while self.waiting:
+            self.waiting.popleft().set_exception(ConnectionError('server closed the connection'))
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        await self.receiver
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+#######################################
+# MAIN
+#######################################
+
+async def serve(args):
+    server = await EvalServer(args.batch_size, args.queue_size).start(args.host, args.port, args.unix)
+    print(f'Serving on {server.address()}', file=sys.stderr)
+    await server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve expression evaluation over newline-delimited JSON.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', metavar='PATH', help='listen on a Unix socket instead of TCP')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--queue-size', type=int, default=QUEUE_SIZE)
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
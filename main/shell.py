@@ -1,8 +1,150 @@
+import argparse
+import json
+import sys
+
 import legacy
 
-while True:
-    text = input('legacy > ')
-    result, error = legacy.run('<stdin>', text)
+#######################################
+# CONSTANTS
+#######################################
+
+# Characters read, and roughly characters written, per chunk in batch mode
+BUFFER_SIZE = 1 << 16
+
+#######################################
+# FORMATS
+#######################################
+
+# Each takes (line number, text, value, error) and returns the output
+# for that line, without its final newline
+
+def format_text(lineno, text, value, error):
+    # What the interactive shell prints
+    if error: return error.as_string()
+    return str(value)
+
+def format_json(lineno, text, value, error):
+    if error: return json.dumps({'line': lineno, 'error': error.as_string()})
+    return json.dumps({'line': lineno, 'value': value.json_value()})
+
+def format_tsv(lineno, text, value, error):
+    # expression, value, error: one row per line, errors on one line too
+    text = text.replace('\t', ' ')
+    if error: return f'{text}\t\t{error.error_name}: {error.details}'
+    return f'{text}\t{value}\t'
+
+FORMATS = {
+    'text': format_text,
+    'json': format_json,
+    'tsv': format_tsv,
+}
+
+#######################################
+# BATCH
+#######################################
+
+def iter_chunks(f, size=BUFFER_SIZE):
+    # Yields lists of (line number, text) for the non-blank lines of f,
+    # one list per `size` characters read. A final line needs no newline
+    lineno = 0
+    rest = ''
+
+    while True:
+        chunk = f.read(size)
+        lines = (rest + chunk).split('\n')
+        rest = lines.pop() if chunk else ''
+
+        numbered = []
+        for text in lines:
+            lineno += 1
+            if text and not text.isspace(): numbered.append((lineno, text))
+        if numbered: yield numbered
+
+        if not chunk: return
+
+def at_line(fn, lineno, text, error):
+    # error, from evaluating text on its own, as at line lineno of fn
+    return error.rebind(legacy.Source(fn, text, lineno - 1))
+
+def run_stream(fn, f, out, formatter=format_text):
+    # Evaluates every line of f and writes one output per chunk read.
+    # Returns True if any line failed
+    failed = False
+
+    for chunk in iter_chunks(f):
+        results = legacy.iter_run(fn, [text for lineno, text in chunk])
+        output = []
+
+        for (lineno, text), (value, error) in zip(chunk, results):
+            if error:
+                failed = True
+                error = at_line(fn, lineno, text, error)
+            output.append(formatter(lineno, text, value, error))
+
+        output.append('')
+        out.write('\n'.join(output))
+
+    return failed
+
+#######################################
+# INTERACTIVE
+#######################################
+
+def repl():
+    while True:
+        try:
+            text = input('legacy > ')
+        except (EOFError, KeyboardInterrupt):
+            print()
+            return
+
+        result, error = legacy.run('<stdin>', text)
+
+        if error: print(error.as_string())
+        else: print(result)
+
+#######################################
+# MAIN
+#######################################
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Evaluate expressions. With no paths and a terminal on stdin, start the interactive shell; '
+                    'otherwise evaluate each line of the paths (or stdin) and print one result per line.'
+    )
+    parser.add_argument('paths', nargs='*', help="files of expressions, one per line; '-' is stdin")
+    parser.add_argument('-f', '--format', choices=FORMATS, default='text', help='output format (default: text)')
+    args = parser.parse_args(argv)
+
+    if not args.paths and sys.stdin.isatty():
+        repl()
+        return 0
+
+    formatter = FORMATS[args.format]
+    out = open(sys.stdout.fileno(), 'w', buffering=BUFFER_SIZE, encoding='utf-8', closefd=False)
+    failed = False
+
+    try:
+        with out:
+            for path in args.paths or ['-']:
+                if path == '-':
+                    f = open(sys.stdin.fileno(), buffering=BUFFER_SIZE, encoding='utf-8', closefd=False)
+                    fn = '<stdin>'
+                else:
+                    try:
+                        f = open(path, buffering=BUFFER_SIZE, encoding='utf-8')
+                    except OSError as e:
+                        # Exits with status 2 once what is written so far is flushed
+                        parser.error(f"can't open '{path}': {e.strerror}")
+                    fn = path
+
+                with f:
+                    failed = run_stream(fn, f, out, formatter) or failed
+    except BrokenPipeError:
+        # The reader went away (e.g. `| head`); nothing left to report to
+        return 1
+
+    return 1 if failed else 0
 
-    if error: print(error.as_string())
-    else: print(result)
\ No newline at end of file
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,297 @@
+import random
+import re
+import threading
+import weakref
+
+import pytest
+
+import legacy
+
+#######################################
+# HELPERS
+#######################################
+
+def context_for(source, limits=None):
+    context = legacy.Context('<program>', source=source, limits=limits)
+    context.symbol_table = legacy.global_symbol_table
+    return context
+
+def outcome(value, error):
+    # What a result looks like to a caller: the value's repr (so 2 and 2.0
+    # differ) or the rendered error
+    if error: return None, error.as_string()
+    return repr(value.value), None
+
+def evaluate_everywhere(text, limits=None):
+    # Outcome of text on every evaluator and compiler, by name
+    source, node, error = legacy.parse_text('<test>', text, limits)
+    assert error is None, error.as_string()
+
+    evaluators = {
+        'Interpreter': lambda context: legacy.Interpreter().visit(node, context),
+        'UnboxedInterpreter': lambda context: legacy.UnboxedInterpreter().visit(node, context),
+        'DagInterpreter': lambda context: legacy.DagInterpreter().visit(node, context),
+        'ClosureCompiler': lambda context: legacy.ClosureCompiler().compile(node, limits).evaluate(context),
+        'PythonCompiler': lambda context: legacy.PythonCompiler().compile(node, limits).evaluate(context),
+        'BytecodeCompiler': lambda context: legacy.BytecodeCompiler().compile(node, limits).evaluate(context),
+        'Bytecode.loads': lambda context: legacy.Bytecode.loads(
+            legacy.BytecodeCompiler().compile(node, limits).dumps()
+        ).evaluate(context),
+    }
+
+    outcomes = {}
+    for name, evaluate in evaluators.items():
+        result = evaluate(context_for(source, limits))
+        outcomes[name] = outcome(result.value, result.error)
+    return outcomes
+
+def run_tiers(text, limits=None, fn='<test>'):
+    # Outcomes of run() until the text has been promoted and run compiled
+    return {outcome(*legacy.run(fn, text, limits)) for _ in range(legacy.tiered_runner.threshold + 2)}
+
+#######################################
+# FORMULAS
+#######################################
+
+# Small and large ints (past 2 ** 53 and 2 ** 64), zeros and floats
+LITERALS = ['0', '1', '2', '7', '12', '0.0', '0.5', '3.25', str(2 ** 53 + 3), str(2 ** 70)]
+
+def random_formula(rng, depth=0):
+    if depth > 4 or rng.random() < 0.3: return rng.choice(LITERALS)
+
+    kind = rng.random()
+    if kind < 0.15: return rng.choice('+-') + random_formula(rng, depth + 1)
+    if kind < 0.3: return '(' + random_formula(rng, depth + 1) + ')'
+    return random_formula(rng, depth + 1) + f' {rng.choice("+-*/")} ' + random_formula(rng, depth + 1)
+
+def random_text(rng):
+    # A formula, one in four times broken by a deleted or inserted character
+    text = random_formula(rng)
+    if rng.random() < 0.25:
+        idx = rng.randrange(len(text) + 1)
+        if rng.random() < 0.5: text = text[:idx] + text[idx + 1:]
+        else: text = text[:idx] + rng.choice('()+*$') + text[idx:]
+    return text
+
+FORMULAS = [random_formula(random.Random(seed)) for seed in range(300)]
+TEXTS = [random_text(random.Random(seed)) for seed in range(600)]
+
+#######################################
+# BASELINE
+#######################################
+
+# What the original run() returned for these texts, except that its arrows
+# under a number ran on to the end of the line (fixed with the regex lexer)
+BASELINE = [
+    ('1 + 2 * 3', 7, None),
+    ('(1 + 2) * 3', 9, None),
+    ('7 / 2', 3.5, None),
+    ('8 / 4', 2.0, None),
+    ('-3 - -4', 1, None),
+    ('+5', 5, None),
+    ('--2.5 * 4', 10.0, None),
+    ('1.5 + 2.25 * (3 - 0.5)', 7.125, None),
+    ('2 * (3 + (4 - 1) / 2) - 10', -1.0, None),
+    ('10 / 3 * 3', 10.0, None),
+    ('1 - 2 - 3', -4, None),
+    ('100 / 10 / 5', 2.0, None),
+    ('   42   ', 42, None),
+    ('0.1 + 0.2', 0.30000000000000004, None),
+    ('123456789 * 987654321 * 1000', 121932631112635269000, None),
+    ('1 / 0', None, 'Traceback (most recent call last):\n  File <stdin>, line 1, in <program>\nRuntime Error: Division by zero\n\n1 / 0\n    ^'),
+    ('2 * (3 + 4) / (5 - 5)', None, 'Traceback (most recent call last):\n  File <stdin>, line 1, in <program>\nRuntime Error: Division by zero\n\n2 * (3 + 4) / (5 - 5)\n               ^^^^^'),
+    ('1 + 2 / (3 - 3) * 4', None, 'Traceback (most recent call last):\n  File <stdin>, line 1, in <program>\nRuntime Error: Division by zero\n\n1 + 2 / (3 - 3) * 4\n         ^^^^^'),
+    ('-(1 / 0.0)', None, 'Traceback (most recent call last):\n  File <stdin>, line 1, in <program>\nRuntime Error: Division by zero\n\n-(1 / 0.0)\n      ^^^'),
+    ('1 + (2 * 3', None, "Invalid Syntax: Expected ')'\nFile <stdin>, line 1\n\n1 + (2 * 3\n          ^"),
+    ('1 2', None, "Invalid Syntax: Expected '+', '-', '*' or '/'\nFile <stdin>, line 1\n\n1 2\n  ^"),
+    ('(1 + 2))', None, "Invalid Syntax: Expected '+', '-', '*' or '/'\nFile <stdin>, line 1\n\n(1 + 2))\n       ^"),
+    ('1 $ 2', None, "Illegal Character: '$'\nFile <stdin>, line 1\n\n1 $ 2\n  ^"),
+    ('1 + 2 @', None, "Illegal Character: '@'\nFile <stdin>, line 1\n\n1 + 2 @\n      ^"),
+]
+
+def reference_run(fn, text):
+    # The original pipeline: all tokens up front, the recursive Parser and
+    # the boxed Interpreter
+    lexer = legacy.Lexer(fn, text)
+    tokens, error = lexer.make_tokens()
+    if error: return None, error
+
+    ast = legacy.Parser(tokens, lexer.source).parse()
+    if ast.error: return None, ast.error
+
+    result = legacy.Interpreter().visit(ast.node, context_for(lexer.source))
+    return result.value, result.error
+
+@pytest.mark.parametrize('text, value, error', BASELINE)
+def test_run_matches_baseline(text, value, error):
+    expected = (None if error else repr(value), error)
+
+    assert outcome(*legacy.run('<stdin>', text)) == expected
+    assert run_tiers(text, fn='<stdin>') == {expected}
+
+def test_run_matches_reference_pipeline():
+    for text in TEXTS:
+        assert outcome(*legacy.run('<stdin>', text)) == outcome(*reference_run('<stdin>', text)), text
+
+#######################################
+# LEXER
+#######################################
+
+def matches(finditer, text):
+    return [(match.lastgroup, match.start(), match.end(), match.group()) for match in finditer(text)]
+
+def test_char_scanner_matches_token_regex():
+    regex = re.compile(legacy.TOKEN_PATTERN, re.DOTALL)
+
+    for text in TEXTS + ['', '1.2.3', '12. 3', 'a_1b 2\t\t3', '_a', 'x\ny\n', 'é1']:
+        assert matches(legacy.CharScanner.finditer, text) == matches(regex.finditer, text), text
+
+#######################################
+# MAPPED FILES
+#######################################
+
+def test_buffer_source_renders_errors_like_source():
+    rng = random.Random(0)
+    context = legacy.Context('<program>')
+
+    for _ in range(2000):
+        lines = [''.join(rng.choice('ab1+ ') for _ in range(rng.randrange(8))) for _ in range(rng.randrange(1, 6))]
+        text = '\n'.join(lines) + rng.choice(['', '\n'])
+        source = legacy.Source('<file>', text)
+        buffer_source = legacy.BufferSource('<file>', memoryview(text.encode()))
+        # Small chunks so the newline searches cross chunk boundaries
+        buffer_source.CHUNK = rng.choice([1, 3, 1 << 16])
+
+        idx_start = rng.randrange(len(text) + 1)
+        idx_end = rng.randrange(idx_start, len(text) + 2)
+        for error in (
+            lambda s: legacy.InvalidSyntaxError(s.pos(idx_start), s.pos(idx_end), 'details'),
+            lambda s: legacy.RTError(s.pos(idx_start), s.pos(idx_end), 'details', context),
+        ):
+            assert error(buffer_source).as_string() == error(source).as_string(), (text, idx_start, idx_end)
+
+def test_run_file_renders_the_error_lines(tmp_path):
+    path = tmp_path / 'formula.txt'
+    path.write_text('1 + 2\n' * 1000)
+
+    _, error = legacy.run_file(path)
+
+    assert error.as_string() == f"Illegal Character: '\n'\nFile {path}, line 1\n\n1 + 2\n     \n1 + 2\n"
+
+#######################################
+# TOKEN BUFFER
+#######################################
+
+def parsed(parser):
+    # A parse as the nodes' reprs and spans, or the rendered error
+    res = parser.parse()
+    if res.error: return res.error.as_string()
+    return [(repr(node), node.pos_start, node.pos_end) for node in legacy.postorder(res.node)]
+
+def test_buffer_parser_matches_iterative_parser():
+    for text in TEXTS:
+        lexer = legacy.Lexer('<stdin>', text)
+        buffer, error = lexer.buffer_tokens()
+        if error: continue
+
+        expected = parsed(legacy.IterativeParser(legacy.Lexer('<stdin>', text).iter_tokens(), lexer.source))
+        assert parsed(legacy.BufferParser(buffer, lexer.source)) == expected, text
+
+def test_buffer_parser_tree_does_not_hold_the_buffer():
+    lexer = legacy.Lexer('<stdin>', '-(a + 2) * 3.5')
+    buffer, _ = lexer.buffer_tokens()
+    node = legacy.BufferParser(buffer, lexer.source).parse().node
+
+    buffer_ref = weakref.ref(buffer)
+    del buffer
+    assert buffer_ref() is None
+    assert repr(node) == '((MINUS, (IDENTIFIER:a, PLUS, INT:2)), MUL, FLOAT:3.5)'
+
+#######################################
+# BACKENDS AND TIERS
+#######################################
+
+@pytest.mark.parametrize('limits', [None, legacy.Limits(max_bits=64)], ids=['default', 'max_bits=64'])
+def test_backends_and_tiers_agree(limits):
+    bit_errors = 0
+
+    for text in FORMULAS:
+        # A literal over max_bits is rejected before any backend sees it
+        _, _, error = legacy.parse_text('<test>', text, limits)
+        if error:
+            assert run_tiers(text, limits) == {outcome(None, error)}
+            continue
+
+        outcomes = evaluate_everywhere(text, limits)
+        expected = outcomes.pop('Interpreter')
+        for name, got in outcomes.items():
+            assert got == expected, (name, text)
+
+        assert run_tiers(text, limits) == {expected}, text
+        if expected[1] and 'bits' in expected[1]: bit_errors += 1
+
+    # The 64-bit limit has to be hit for the comparison to mean anything
+    assert (bit_errors > 0) == (limits is not None)
+
+def test_limits_are_per_call():
+    text = f'{2 ** 40} * {2 ** 40}'
+
+    assert legacy.run('<test>', text)[0].value == 2 ** 80
+    assert legacy.run('<test>', text, legacy.Limits(max_bits=64))[1].details == 'Result exceeds 64 bits'
+    assert legacy.run('<test>', text)[0].value == 2 ** 80
+
+#######################################
+# OVERFLOW
+#######################################
+
+BIG = '9' * 400
+
+@pytest.mark.parametrize('text', [
+    f'{BIG} * 1.5',
+    f'{BIG} / 3',
+    f'1.5 + {BIG}',
+    f'{BIG} - 0.5',
+    f'1 + {BIG} / 7',
+    f'-({BIG}) * 2.0',
+    f'2 * ({BIG} * 1.5) / 0',
+    f'1 / 0 + {BIG} * 1.5',
+])
+def test_float_overflow_is_the_same_error_everywhere(text):
+    outcomes = evaluate_everywhere(text)
+    expected = outcomes.pop('Interpreter')
+
+    assert expected[1] is not None
+    for name, got in outcomes.items():
+        assert got == expected, name
+
+    assert run_tiers(text) == {expected}
+
+def test_float_overflow_spans_its_node():
+    value, error = legacy.run('<test>', f'1 + {BIG} / 7')
+
+    assert value is None
+    assert error.details == 'Result too large for a float'
+    assert (error.pos_start.idx, error.pos_end.idx) == (4, 4 + len(BIG) + 4)
+
+def test_float_overflow_does_not_stop_a_batch():
+    values, errors = legacy.run_many('<test>', [f'{BIG} * 1.5', '1 + 1'])
+
+    assert values[1].value == 2
+    assert errors[0].details == 'Result too large for a float'
+
+#######################################
+# THREADS
+#######################################
+
+def test_exited_threads_keep_their_counts_but_not_their_entries():
+    runner = legacy.tiered_runner
+    runner.reset()
+
+    for _ in range(50):
+        thread = threading.Thread(target=legacy.run, args=('<test>', '1 + 2'))
+        thread.start()
+        thread.join()
+    info = runner.info()
+
+    assert len(runner.thread_counters) <= 1
+    assert info.interpreted_runs + info.compiled_runs == 50
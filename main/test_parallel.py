@@ -0,0 +1,63 @@
+import pickle
+
+import pytest
+
+import legacy
+import parallel
+from test_legacy import TEXTS
+
+#######################################
+# ERRORS
+#######################################
+
+@pytest.mark.parametrize('limits', [None, legacy.Limits(max_nodes=5, max_bits=16)], ids=['default', 'limits'])
+def test_errors_survive_serialization(limits):
+    errors = 0
+
+    for text in TEXTS:
+        _, error = legacy.run('<stdin>', text, limits)
+        if not error: continue
+
+        # As sent between processes
+        data = pickle.loads(pickle.dumps(parallel.serialize_error(error)))
+        got = parallel.deserialize_error(data, '<stdin>', text)
+
+        assert type(got) is type(error)
+        assert got.as_string() == error.as_string(), text
+        errors += 1
+
+    assert errors > 0
+
+#######################################
+# MAIN
+#######################################
+
+@pytest.mark.parametrize('args', [['--threads'], ['-j', '2', '--chunksize', '1']], ids=['threads', 'processes'])
+def test_main_reports_errors_at_their_lines(tmp_path, capfd, args):
+    path = tmp_path / 'formulas.txt'
+    path.write_text('1 + 2\n\n1 / 0\n   \n2 $\n4 * 5')
+
+    assert parallel.main([*args, str(path)]) == 1
+
+    assert capfd.readouterr().out == (
+        '3\n'
+        'Traceback (most recent call last):\n'
+        f'  File {path}, line 3, in <program>\n'
+        'Runtime Error: Division by zero\n'
+        '\n'
+        '1 / 0\n'
+        '    ^\n'
+        "Illegal Character: '$'\n"
+        f'File {path}, line 5\n'
+        '\n'
+        '2 $\n'
+        '  ^\n'
+        '20\n'
+    )
+
+def test_main_without_errors_succeeds(tmp_path, capfd):
+    path = tmp_path / 'formulas.txt'
+    path.write_text('1 + 2\n7 / 2\n')
+
+    assert parallel.main(['--threads', str(path)]) == 0
+    assert capfd.readouterr().out == '3\n3.5\n'
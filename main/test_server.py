@@ -0,0 +1,94 @@
+import asyncio
+import json
+import math
+
+import pytest
+
+import legacy
+import server
+from test_legacy import TEXTS
+
+# Float literals past the largest float, so results are inf, -inf and nan
+INF = '9' * 400 + '.0'
+
+def serve(test):
+    # Runs test(address) against a fresh server on a free port
+    async def main():
+        eval_server = await server.EvalServer().start()
+        try: return await test(eval_server.address())
+        finally: await eval_server.close()
+
+    return asyncio.run(main())
+
+def strict_loads(line):
+    return json.loads(line, parse_constant=server.reject_constant)
+
+#######################################
+# REQUESTS
+#######################################
+
+@pytest.mark.parametrize('line, request_id, error', [
+    (b'{"id": 5}', 5, "KeyError('text')"),
+    (b'{"id": 5, "text": 3}', 5, 'text and fn must be strings'),
+    (b'{"id": "a", "text": "1", "fn": null}', 'a', 'text and fn must be strings'),
+    (b'[5]', None, 'AttributeError'),
+    (b'{"id": 5, "text": "1"', None, 'JSONDecodeError'),
+    (b'{"id": NaN, "text": "1"}', None, 'NaN is not JSON'),
+    (b'{"id": 5, "text": "1", "x": -Infinity}', None, '-Infinity is not JSON'),
+])
+def test_bad_requests_are_answered_under_their_id(line, request_id, error):
+    async def parse():
+        future = asyncio.get_running_loop().create_future()
+        return server.EvalServer().parse_request(line, future), future.result()
+
+    request, response = asyncio.run(parse())
+
+    assert request is None
+    assert response['id'] == request_id
+    assert response['error'].startswith('Bad request: ') and error in response['error']
+
+def test_good_request_keeps_its_id_and_fn():
+    async def parse():
+        future = asyncio.get_running_loop().create_future()
+        return server.EvalServer().parse_request(b'{"id": [1], "text": "1 + 2", "fn": "f"}', future)
+
+    assert asyncio.run(parse())[:3] == ([1], 'f', '1 + 2')
+
+#######################################
+# RESPONSES
+#######################################
+
+def test_responses_are_strict_json():
+    texts = [INF, f'-{INF}', f'{INF} - {INF}', '1 / 0', '1 + 2']
+
+    async def test(address):
+        reader, writer = await asyncio.open_connection(*address)
+        for request_id, text in enumerate(texts):
+            writer.write(json.dumps({'id': request_id, 'text': text}).encode() + b'\n')
+        lines = [await reader.readline() for _ in texts]
+        writer.close()
+        return [strict_loads(line) for line in lines]
+
+    responses = serve(test)
+
+    assert [response['id'] for response in responses] == list(range(len(texts)))
+    assert [response.get('value') for response in responses] == ['inf', '-inf', 'nan', None, 3]
+    assert 'Division by zero' in responses[3]['error']
+
+def test_client_matches_run():
+    texts = TEXTS[:200] + [INF, f'{INF} * 0']
+
+    async def test(address):
+        async with await server.EvalClient.connect(*address) as client:
+            return await client.evaluate_many(texts)
+
+    results = serve(test)
+
+    for text, (value, error) in zip(texts, results):
+        expected_value, expected_error = legacy.run('<stdin>', text)
+        if expected_error:
+            assert (value, error) == (None, expected_error.as_string()), text
+        elif math.isnan(expected_value.value):
+            assert math.isnan(value) and error is None
+        else:
+            assert (value, error) == (expected_value.value, None), text
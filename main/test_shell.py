@@ -0,0 +1,92 @@
+import io
+import json
+import random
+
+import pytest
+
+import legacy
+import server
+import shell
+
+#######################################
+# BATCH
+#######################################
+
+def random_lines(rng):
+    # Formulas mixed with empty and whitespace-only lines
+    return [rng.choice(['', ' ', '\t ', '1 + 2', '3 $', 'a * (2']) for _ in range(rng.randrange(1, 12))]
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, shell.BUFFER_SIZE])
+def test_iter_chunks_numbers_non_blank_lines(size):
+    rng = random.Random(size)
+
+    for _ in range(200):
+        lines = random_lines(rng)
+        text = '\n'.join(lines) + rng.choice(['', '\n'])
+        expected = [(lineno, line) for lineno, line in enumerate(lines, 1) if line.strip()]
+
+        chunks = list(shell.iter_chunks(io.StringIO(text), size))
+
+        assert [line for chunk in chunks for line in chunk] == expected, (text, size)
+        assert all(chunks)
+
+def test_iter_chunks_reads_size_characters_per_chunk():
+    text = '1 + 2\n' * 100
+
+    assert len(list(shell.iter_chunks(io.StringIO(text), len(text)))) == 1
+    assert len(list(shell.iter_chunks(io.StringIO(text), 60))) == 10
+
+def test_at_line_renders_the_error_at_that_line():
+    _, error = legacy.run('<stdin>', '1 +')
+
+    assert shell.at_line('formulas.txt', 7, '1 +', error).as_string() == (
+        'Invalid Syntax: Expected int, float or identifier\n'
+        'File formulas.txt, line 7\n'
+        '\n'
+        '1 +\n'
+        '   ^'
+    )
+
+def test_run_stream_reports_file_line_numbers():
+    out = io.StringIO()
+
+    assert shell.run_stream('f.txt', io.StringIO('1 + 2\n\n \n3 $\n7 / 2'), out, shell.format_json)
+    assert [json.loads(line) for line in out.getvalue().splitlines()] == [
+        {'line': 1, 'value': 3},
+        {'line': 4, 'error': "Illegal Character: '$'\nFile f.txt, line 4\n\n3 $\n  ^"},
+        {'line': 5, 'value': 3.5},
+    ]
+
+def test_run_stream_without_errors_returns_false():
+    out = io.StringIO()
+
+    assert not shell.run_stream('f.txt', io.StringIO('1 + 2\n'), out)
+    assert out.getvalue() == '3\n'
+
+#######################################
+# FORMATS
+#######################################
+
+@pytest.mark.parametrize('text, value', [
+    ('9' * 400 + '.0', 'inf'),
+    ('-' + '9' * 400 + '.0', '-inf'),
+    ('9' * 400 + '.0 * 0', 'nan'),
+    ('7 / 2', 3.5),
+    (str(2 ** 70), 2 ** 70),
+])
+def test_format_json_is_strict_json(text, value):
+    result, error = legacy.run('<stdin>', text)
+    line = shell.format_json(3, text, result, error)
+
+    assert json.loads(line, parse_constant=server.reject_constant) == {'line': 3, 'value': value}
+
+#######################################
+# MAIN
+#######################################
+
+def test_main_rejects_a_missing_path(tmp_path, capfd):
+    with pytest.raises(SystemExit) as exc_info:
+        shell.main([str(tmp_path / 'missing.txt')])
+
+    assert exc_info.value.code == 2
+    assert "can't open" in capfd.readouterr().err
@@ -0,0 +1,120 @@
+import random
+
+import pytest
+
+import legacy
+from test_legacy import TEXTS, outcome, random_text
+
+np = pytest.importorskip('numpy')
+vectorized = pytest.importorskip('vectorized')
+
+#######################################
+# BATCH
+#######################################
+
+def test_evaluate_batch_matches_run():
+    # Every shape several times over, so groups have more than one row
+    texts = TEXTS + [random_text(random.Random(seed)) for seed in range(600)]
+
+    result = vectorized.evaluate_batch('<stdin>', texts)
+
+    for idx, text in enumerate(texts):
+        value = None if result.errors[idx] else repr(result.values[idx])
+        error = result.error(idx)
+        assert (value, error.as_string() if error else None) == outcome(*legacy.run('<stdin>', text)), text
+
+#######################################
+# COLUMNS
+#######################################
+
+def scalar_outcome(text, **row):
+    # outcome() of text with each name bound to one row's Python value
+    source, node, error = legacy.parse_text('<vectorized>', text)
+    context = legacy.Context('<program>', source=source)
+    context.symbol_table = legacy.SymbolTable()
+    for name, value in row.items(): context.symbol_table.set(name, value)
+
+    result = legacy.BytecodeCompiler().compile(node).evaluate(context)
+    return outcome(result.value, result.error)
+
+def vector_outcomes(result):
+    # outcome() of every row of a VectorResult
+    outcomes = []
+    values = result.values.tolist()
+    for idx in range(len(result)):
+        error = result.error(idx)
+        assert bool(result.errors[idx]) == (error is not None)
+        outcomes.append((None, error.as_string()) if error else (repr(values[idx]), None))
+    return outcomes
+
+def test_run_vectorized_without_arrays_has_one_row():
+    result, error = vectorized.run_vectorized('1 / 0')
+
+    assert len(result) == 1
+    assert result.error(0).details == 'Division by zero'
+
+@pytest.mark.parametrize('text', [
+    'a * a',
+    'a * b + 3037000500 * 3037000500',
+    '1 / (a * a)',
+    'a / b',
+    '-a - b',
+    '(a - b) * (a + b) / 7',
+    'a * 0.5 + b',
+])
+def test_int_columns_are_exact_or_fall_back(text):
+    # Values around the limits where int64 wraps and float64 rounds
+    a = np.array([0, 3, -7, 2 ** 31, 2 ** 32, -2 ** 40, 2 ** 53 + 1, 2 ** 62, -2 ** 63, 2 ** 63 - 1])
+    b = np.array([1, 0, 3, -2 ** 32, 2 ** 32, 2 ** 30, 3, -5, 1, 2])
+
+    result, error = vectorized.run_vectorized(text, a=a, b=b)
+    assert error is None
+
+    expected = [scalar_outcome(text, a=int(x), b=int(y)) for x, y in zip(a, b)]
+    assert vector_outcomes(result) == expected
+
+def test_run_chunked_reports_ints_that_do_not_fit(tmp_path):
+    a = np.array([3, 2 ** 40, -5])
+
+    result, error = vectorized.run_chunked('a * a', tmp_path / 'out.npy', block_rows=2, a=a)
+
+    assert error is None
+    assert result.values.dtype == np.int64
+    assert result.errors.tolist() == [False, True, False]
+    assert result.values[[0, 2]].tolist() == [9, 25]
+    assert result.error(1).details == f'Result {2 ** 80} does not fit in int64'
+
+#######################################
+# OUT-OF-CORE
+#######################################
+
+@pytest.mark.parametrize('text', [
+    'a + b * c',
+    '(a - 2) / b',
+    'a / (b - 1) + 0.5',
+    '-a * 3 - c / 2',
+    'c * c / (a - a)',
+    '7 / 2',
+])
+def test_run_chunked_matches_run_vectorized(text, tmp_path):
+    rng = np.random.default_rng(0)
+    columns = {
+        'a': rng.integers(-3, 4, 1000),
+        'b': rng.integers(0, 3, 1000).astype(np.float64),
+        'c': rng.standard_normal(1000),
+    }
+    np.save(tmp_path / 'c.npy', columns['c'])
+
+    expected, error = vectorized.run_vectorized(text, **columns)
+    assert error is None
+    # A block size that does not divide the rows, and a column from a file
+    got, error = vectorized.run_chunked(
+        text, tmp_path / 'out.npy', block_rows=97, a=columns['a'], b=columns['b'], c=tmp_path / 'c.npy'
+    )
+    assert error is None
+
+    assert got.values.dtype == expected.values.dtype
+    assert np.array_equal(got.values, expected.values, equal_nan=True)
+    assert np.array_equal(got.errors, expected.errors)
+    for idx in np.flatnonzero(expected.errors)[:5]:
+        assert got.error(idx).as_string() == expected.error(idx).as_string()
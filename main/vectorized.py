@@ -0,0 +1,580 @@
+import os
+import tempfile
+
+import numpy as np
+
+import legacy
+
+#######################################
+# CONSTANTS
+#######################################
+
+# Int intermediates below this convert to float exactly, so numpy and
+# Python agree on every operation; rows that reach it are run by the scalar
+# interpreter instead
+EXACT_INT_LIMIT = 2 ** 53
+
+# An int result is taken to have wrapped when a float64 estimate of it is
+# past this share of its dtype's range; the estimate is off by a few ulps
+INT_RANGE_MARGIN = 1 - 2 ** -20
+
+TT_NEG = 'NEG'
+
+# Rows per block in run_chunked: a float64 temporary is 512 KiB, so the
+# few a formula needs stay in cache between operators, while the per-block
+# Python overhead is spread over enough rows not to show
+BLOCK_ROWS = 1 << 16
+
+#######################################
+# SHAPES
+#######################################
+
+def shape_of(node):
+    # Returns the AST in postorder with literal values left out, and the
+    # literal values in the same order. Literal types stay in the shape so
+    # every row of a group has the same int/float result types; a variable
+    # is kept as (TT_IDENTIFIER, name)
+    shape = []
+    literals = []
+
+    for current in legacy.postorder(node):
+        if isinstance(current, legacy.NumberNode):
+            shape.append(current.tok.type)
+            literals.append(current.tok.value)
+        elif isinstance(current, legacy.VarAccessNode):
+            shape.append((legacy.TT_IDENTIFIER, current.var_name_tok.value))
+        elif isinstance(current, legacy.BinOpNode):
+            shape.append(current.op_tok.type)
+        elif current.op_tok.type == legacy.TT_MINUS:
+            shape.append(TT_NEG)
+
+    return tuple(shape), literals
+
+def leaves_of(node, leaf_class):
+    # Yields the NumberNodes or VarAccessNodes of an AST in evaluation order
+    return (current for current in legacy.postorder(node) if isinstance(current, leaf_class))
+
+#######################################
+# GROUP EVALUATION
+#######################################
+
+def int_column(values):
+    # int64 column plus a mask of literals too large to use as-is
+    too_large = np.fromiter((value >= EXACT_INT_LIMIT for value in values), dtype=bool, count=len(values))
+    column = np.fromiter((0 if value >= EXACT_INT_LIMIT else value for value in values), dtype=np.int64, count=len(values))
+    return column, too_large
+
+def evaluate_shape(shape, columns):
+    # Evaluates one shape over its literal columns (lists, in shape order).
+    # Returns (values, zero_division, fallback): rows in zero_division
+    # divide by zero somewhere, rows in fallback need the scalar interpreter
+    n_rows = len(columns[0])
+    zero_division = np.zeros(n_rows, dtype=bool)
+    fallback = np.zeros(n_rows, dtype=bool)
+    literals = iter(columns)
+
+    # Entries are (array, is_int)
+    stack = []
+    with np.errstate(all='ignore'):
+        for code in shape:
+            if code == legacy.TT_INT:
+                column, too_large = int_column(next(literals))
+                fallback |= too_large
+                stack.append((column, True))
+            elif code == legacy.TT_FLOAT:
+                stack.append((np.array(next(literals), dtype=np.float64), False))
+
+            elif code == TT_NEG:
+                operand, is_int = stack.pop()
+                stack.append((operand * -1, is_int))
+
+            else:
+                right, right_int = stack.pop()
+                left, left_int = stack.pop()
+
+                if code == legacy.TT_DIV:
+                    zero_division |= right == 0
+                    stack.append((np.true_divide(left, right), False))
+                    continue
+
+                if code == legacy.TT_PLUS: result = left + right
+                elif code == legacy.TT_MINUS: result = left - right
+                else: result = left * right
+
+                if left_int and right_int:
+                    # Operands are below the limit, so only a product can
+                    # wrap; check it against a float estimate instead
+                    estimate = left.astype(np.float64) * right if code == legacy.TT_MUL else result
+                    fallback |= np.abs(estimate) >= EXACT_INT_LIMIT
+
+                stack.append((result, left_int and right_int))
+
+    values, _ = stack.pop()
+    return values, zero_division, fallback
+
+#######################################
+# BATCH
+#######################################
+
+class BatchResult:
+    # values[i] is the plain number run(fn, texts[i]) would give, or None
+    # where errors[i] is set. error(i) builds that row's Error
+    def __init__(self, fn, texts, values, errors, known_errors, groups):
+        self.fn = fn
+        self.texts = texts
+        self.values = values
+        self.errors = errors
+        self.known_errors = known_errors
+        self.groups = groups
+
+    def error(self, idx):
+        if not self.errors[idx]: return None
+        if idx not in self.known_errors:
+            self.known_errors[idx] = legacy.run(self.fn, self.texts[idx])[1]
+        return self.known_errors[idx]
+
+    def __len__(self):
+        return len(self.values)
+
+    def __repr__(self):
+        return f'<BatchResult {len(self)} rows, {int(self.errors.sum())} errors, {self.groups} shapes>'
+
+def evaluate_batch(fn, texts):
+    # Parses every text, groups the ASTs by shape and evaluates each group
+    # with one pass of numpy operations over its literal columns
+    texts = list(texts)
+    values = [None] * len(texts)
+    errors = np.zeros(len(texts), dtype=bool)
+    known_errors = {}
+    groups = {}
+
+    for idx, text in enumerate(texts):
+        source, node, error = legacy.parse_text(fn, text)
+        if error:
+            errors[idx] = True
+            known_errors[idx] = error
+            continue
+
+        shape, literals = shape_of(node)
+        rows, columns = groups.setdefault(shape, ([], [[] for _ in literals]))
+        rows.append(idx)
+        for column, literal in zip(columns, literals): column.append(literal)
+
+    for shape, (rows, columns) in groups.items():
+        # Variables come from the scalar symbol table, so run() takes those
+        if any(code.__class__ is tuple for code in shape):
+            fallback = [True] * len(rows)
+            group_values = zero_division = None
+        else:
+            group_values, zero_division, fallback = evaluate_shape(shape, columns)
+            group_values = group_values.tolist()
+            zero_division = zero_division.tolist()
+            fallback = fallback.tolist()
+
+        for i, idx in enumerate(rows):
+            if fallback[i]:
+                value, error = legacy.run(fn, texts[idx])
+                if error:
+                    errors[idx] = True
+                    known_errors[idx] = error
+                else:
+                    values[idx] = value.value
+            elif zero_division[i]:
+                errors[idx] = True
+            else:
+                values[idx] = group_values[i]
+
+    return BatchResult(fn, texts, values, errors, known_errors, len(groups))
+
+#######################################
+# COLUMNS
+#######################################
+
+class LiteralOverflow(Exception):
+    # An int literal numpy cannot convert to the dtype of what it meets,
+    # e.g. one past int64 times an int64 column
+    def __init__(self, literal, dtype):
+        super().__init__(f'{literal} does not fit in {dtype}')
+        self.literal = literal
+        self.dtype = dtype
+
+def int_bounds(value):
+    # (min, max) of an int array or scalar as Python ints, or None if value
+    # is not an int
+    if value.__class__ is int: return value, value
+    value = np.asarray(value)
+    if value.dtype.kind not in 'iu': return None
+    if value.size == 0: return 0, 0
+    return int(value.min()), int(value.max())
+
+def may_be_inexact(ufunc, args, left, right):
+    # Whether numpy's ufunc on int operands with bounds left and right can
+    # differ from Python's exact ints on some row. Returns that and the
+    # bounds of the exact results (None when numpy gives floats)
+    if ufunc is np.true_divide:
+        return max(map(abs, left + right)) >= EXACT_INT_LIMIT, None
+
+    if ufunc is np.add: bounds = left[0] + right[0], left[1] + right[1]
+    elif ufunc is np.subtract: bounds = left[0] - right[1], left[1] - right[0]
+    else:
+        products = [a * b for a in left for b in right]
+        bounds = min(products), max(products)
+
+    dtype = np.result_type(*args)
+    if dtype.kind in 'iu':
+        info = np.iinfo(dtype)
+        return bounds[0] < info.min or bounds[1] > info.max, bounds
+    return max(map(abs, left + right + bounds)) >= EXACT_INT_LIMIT, None
+
+def inexact_rows(ufunc, floats, result):
+    # Mask of the rows where numpy's result of ufunc on int operands may not
+    # be the exact one Python computes; floats are the operands as float64
+    if result.dtype.kind in 'iu':
+        # Wrapped around
+        info = np.iinfo(result.dtype)
+        estimate = ufunc(*floats)
+        return (estimate < info.min * INT_RANGE_MARGIN) | (estimate > info.max * INT_RANGE_MARGIN)
+
+    # Computed in float64 (a division, or uint64 with int64), which only
+    # holds ints below EXACT_INT_LIMIT exactly
+    inexact = (np.abs(floats[0]) >= EXACT_INT_LIMIT) | (np.abs(floats[1]) >= EXACT_INT_LIMIT)
+    if ufunc is np.true_divide: return inexact
+    return inexact | (np.abs(ufunc(*floats)) >= EXACT_INT_LIMIT)
+
+def apply_ufunc(ufunc, args, **kwargs):
+    # ufunc(*args), raising LiteralOverflow where numpy's own OverflowError
+    # would not say which literal failed to convert
+    try:
+        return ufunc(*args, **kwargs)
+    except OverflowError:
+        # Only literals reach a ufunc as Python ints
+        for idx, arg in enumerate(args):
+            if arg.__class__ is not int: continue
+            dtype = np.result_type(*args[:idx], *args[idx + 1:])
+            try: np.array(arg, dtype=dtype)
+            except OverflowError: raise LiteralOverflow(arg, dtype) from None
+        raise
+
+def literal_too_large(source, node, overflow):
+    # The RTError for a LiteralOverflow, spanning the first int literal with
+    # its value (or the whole formula for the -1 a negation multiplies by)
+    span = node
+    for number_node in leaves_of(node, legacy.NumberNode):
+        if number_node.tok.type == legacy.TT_INT and number_node.tok.value == overflow.literal:
+            span = number_node
+            break
+
+    context = legacy.Context('<program>', source=source)
+    return legacy.RTError(source.pos(span.pos_start), source.pos(span.pos_end), str(overflow), context)
+
+class ColumnEvaluator:
+    # Evaluates one shape with each variable bound to its column and the
+    # literals as scalars, one numpy operation per operator. Arithmetic
+    # follows numpy's dtypes. evaluate() returns the values and leaves the
+    # rows that divide by zero in zero_division, and in inexact those where
+    # ints wrapped around or lost precision in float64 (their values are
+    # wrong, so the caller runs them on the scalar VM); it raises
+    # LiteralOverflow for a literal that does not fit its operand's dtype.
+    # Subclasses change where results and masks are stored through apply(),
+    # divides_by() and loses_exactness(), not how they are computed
+    def __init__(self, shape, literals):
+        self.shape = shape
+        self.literals = literals
+        self.zero_division = np.False_
+        self.inexact = np.False_
+
+    def evaluate(self, columns):
+        literals = iter(self.literals)
+        column_bounds = {}
+
+        # Each entry's exact int bounds (see int_bounds) are kept alongside
+        # it, so rows are only checked where an operator could wrap around
+        stack = []
+        bounds = []
+        with np.errstate(all='ignore'):
+            for step, code in enumerate(self.shape):
+                if code.__class__ is tuple:
+                    name = code[1]
+                    if name not in column_bounds: column_bounds[name] = int_bounds(columns[name])
+                    stack.append(columns[name])
+                    bounds.append(column_bounds[name])
+                    continue
+                elif code == legacy.TT_INT or code == legacy.TT_FLOAT:
+                    literal = next(literals)
+                    stack.append(literal)
+                    bounds.append(int_bounds(literal))
+                    continue
+
+                right_bounds = bounds.pop()
+                if code == TT_NEG:
+                    ufunc, args = np.multiply, (stack.pop(), -1)
+                    left_bounds, right_bounds = right_bounds, (-1, -1)
+                else:
+                    left_bounds = bounds.pop()
+                    right = stack.pop()
+                    left = stack.pop()
+
+                    if code == legacy.TT_PLUS: ufunc = np.add
+                    elif code == legacy.TT_MINUS: ufunc = np.subtract
+                    elif code == legacy.TT_MUL: ufunc = np.multiply
+                    else:
+                        ufunc = np.true_divide
+                        self.divides_by(right)
+                    args = (left, right)
+
+                check, result_bounds = False, None
+                if left_bounds is not None and right_bounds is not None:
+                    check, result_bounds = may_be_inexact(ufunc, args, left_bounds, right_bounds)
+                if check:
+                    # Taken before apply(), which may overwrite an operand
+                    try: floats = [np.asarray(arg, dtype=np.float64) for arg in args]
+                    except OverflowError: check = False  # A literal apply() rejects
+
+                result = self.apply(step, len(stack), ufunc, args)
+                if check: self.loses_exactness(inexact_rows(ufunc, floats, result))
+                stack.append(result)
+                bounds.append(result_bounds)
+
+        return stack.pop()
+
+    def divides_by(self, divisor):
+        self.zero_division = self.zero_division | (np.asarray(divisor) == 0)
+
+    def loses_exactness(self, rows):
+        self.inexact = self.inexact | rows
+
+    def apply(self, step, depth, ufunc, args):
+        # step is the operator's index in the shape, depth the stack depth
+        # its result goes to
+        return apply_ufunc(ufunc, args)
+
+def run_row(bytecode, source, columns, idx):
+    # The RTResult of bytecode on row idx of columns (broadcast to the same
+    # rows), on the VM, which unlike the tree walkers takes any depth
+    context = legacy.Context('<program>', source=source)
+    context.symbol_table = legacy.SymbolTable()
+    for name, column in columns.items():
+        context.symbol_table.set(name, column[idx].item())
+
+    return bytecode.evaluate(context)
+
+class VectorResult:
+    # values[i] is the formula's value on row i of the columns. Rows set in
+    # errors have a runtime error or, from run_chunked, an exact value that
+    # does not fit the output's dtype; their values are meaningless. error(i)
+    # builds that row's RTError
+    def __init__(self, source, node, columns, values, errors):
+        self.source = source
+        self.node = node
+        self.columns = columns
+        self.values = values
+        self.errors = errors
+
+    def error(self, idx):
+        if not self.errors[idx]: return None
+
+        result = run_row(legacy.BytecodeCompiler().compile(self.node), self.source, self.columns, idx)
+        if result.error: return result.error
+
+        context = legacy.Context('<program>', source=self.source)
+        return legacy.RTError(
+            self.source.pos(self.node.pos_start), self.source.pos(self.node.pos_end),
+            f'Result {result.value.value} does not fit in {self.values.dtype}', context
+        )
+
+    def __len__(self):
+        return len(self.values)
+
+    def __repr__(self):
+        return f'<VectorResult {len(self)} rows, {int(self.errors.sum())} errors>'
+
+def unbound_name(source, node, columns):
+    # The RTError for the first name in node that is not a column, or None
+    for var_node in leaves_of(node, legacy.VarAccessNode):
+        name = var_node.var_name_tok.value
+        if name not in columns:
+            context = legacy.Context('<program>', source=source)
+            return legacy.name_not_defined(name, var_node.pos_start, var_node.pos_end, context).error
+    return None
+
+def run_vectorized(text, **columns):
+    # Parses text once and evaluates it over whole columns: each name in the
+    # formula is bound to the array (or scalar) passed under that name, and
+    # the columns broadcast against each other and against one row, so even
+    # a formula with no arrays gives a 1-D result. Rows where int64 (or
+    # another int dtype) would wrap around are run on the scalar VM instead,
+    # and values becomes an object array if an exact result needs it.
+    # Returns (VectorResult, error) like run(); error is only set for a
+    # syntax error, an unbound name or an int literal too large for the
+    # dtype it meets
+    source, node, error = legacy.parse_cache.parse('<vectorized>', text)
+    if error: return None, error
+
+    columns = {name: np.asarray(column) for name, column in columns.items()}
+    error = unbound_name(source, node, columns)
+    if error: return None, error
+
+    rows = np.broadcast_shapes((1,), *(column.shape for column in columns.values()))
+    evaluator = ColumnEvaluator(*shape_of(node))
+    try:
+        values = evaluator.evaluate(columns)
+    except LiteralOverflow as e:
+        return None, literal_too_large(source, node, e)
+
+    # A formula that does not use every column still gets one value per row
+    if np.shape(values) != rows: values = np.broadcast_to(values, rows).copy()
+    errors = evaluator.zero_division & ~evaluator.inexact
+    if errors.shape != rows: errors = np.broadcast_to(errors, rows).copy()
+    columns = {name: np.broadcast_to(column, rows) for name, column in columns.items()}
+
+    inexact = np.flatnonzero(np.broadcast_to(evaluator.inexact, rows))
+    if len(inexact):
+        bytecode = legacy.BytecodeCompiler().compile(node)
+        for idx in inexact:
+            result = run_row(bytecode, source, columns, idx)
+            if result.error:
+                errors[idx] = True
+                continue
+            try:
+                values[idx] = result.value.value
+            except OverflowError:
+                values = values.astype(object)
+                values[idx] = result.value.value
+
+    return VectorResult(source, node, columns, values, errors), None
+
+#######################################
+# OUT-OF-CORE
+#######################################
+
+def open_column(path, dtype=np.float64):
+    # Maps a column file read-only: .npy files with their own dtype and
+    # length, anything else as raw values of dtype
+    if os.fspath(path).endswith('.npy'): return np.load(path, mmap_mode='r')
+    return np.memmap(path, dtype=dtype, mode='r')
+
+class BlockEvaluator(ColumnEvaluator):
+    # ColumnEvaluator for one block of rows at a time. The value at each
+    # stack depth is written into a temporary kept per (depth, dtype),
+    # allocated on the first block and passed as out= on every later one.
+    # An operator may overwrite its own left operand that way, which numpy
+    # allows for elementwise operations
+    def __init__(self, shape, literals, block_rows):
+        super().__init__(shape, literals)
+        self.block_rows = block_rows
+        self.temps = {}
+        self.dtypes = [None] * len(shape)
+        self.zero = np.empty(block_rows, dtype=bool)
+        self.inexact_block = np.empty(block_rows, dtype=bool)
+        self.n_rows = 0
+
+    def evaluate(self, columns, n_rows, errors):
+        # columns hold this block's slices; errors (n_rows bools) is
+        # overwritten with the block's zero-division mask, and inexact with
+        # the rows to run on the VM
+        self.n_rows = n_rows
+        self.zero_division = errors
+        self.inexact = self.inexact_block[:n_rows]
+        errors[:] = False
+        self.inexact[:] = False
+        return super().evaluate(columns)
+
+    def divides_by(self, divisor):
+        zero = self.zero[:self.n_rows]
+        np.equal(divisor, 0, out=zero)
+        np.logical_or(self.zero_division, zero, out=self.zero_division)
+
+    def loses_exactness(self, rows):
+        np.logical_or(self.inexact, rows, out=self.inexact)
+
+    def apply(self, step, depth, ufunc, args):
+        dtype = self.dtypes[step]
+        if dtype is not None:
+            return ufunc(*args, out=self.temps[depth, dtype][:self.n_rows])
+
+        # First block: let numpy pick the result, then keep it as the
+        # temporary if this depth has none of its dtype yet. Literals that
+        # do not fit are found here, as dtypes are the same for every block
+        result = apply_ufunc(ufunc, args)
+        if np.ndim(result) == 1:
+            self.dtypes[step] = result.dtype
+            temp = self.temps.setdefault((depth, result.dtype), np.empty(self.block_rows, result.dtype))
+            temp[:self.n_rows] = result
+            result = temp[:self.n_rows]
+        return result
+
+def run_chunked(text, out_path, errors_path=None, block_rows=BLOCK_ROWS, **columns):
+    # Out-of-core run_vectorized. Columns may be arrays, np.memmaps or
+    # paths for open_column, all 1-D with the same length, or scalars
+    # (which, with no arrays among them, make one row). The output's dtype
+    # is fixed, so a row whose exact int result does not fit it is marked
+    # in errors instead.
+    # Values go to a .npy file at out_path and the errors mask to one at
+    # errors_path (an anonymous temporary file by default), both mapped,
+    # so memory use depends on block_rows and not on the row count
+    source, node, error = legacy.parse_cache.parse('<vectorized>', text)
+    if error: return None, error
+
+    columns = {
+        name: open_column(column) if isinstance(column, (str, os.PathLike)) else np.asarray(column)
+        for name, column in columns.items()
+    }
+    error = unbound_name(source, node, columns)
+    if error: return None, error
+
+    rows = np.broadcast_shapes((1,), *(column.shape for column in columns.values()))
+    if len(rows) != 1: raise ValueError(f'run_chunked needs 1-D columns, got shape {rows}')
+    n_rows = rows[0]
+
+    if errors_path is None:
+        errors = np.memmap(tempfile.TemporaryFile(), dtype=bool, mode='w+', shape=rows)
+    else:
+        errors = np.lib.format.open_memmap(errors_path, mode='w+', dtype=bool, shape=rows)
+
+    evaluator = BlockEvaluator(*shape_of(node), block_rows)
+    bytecode = None
+    values = None
+
+    # Blocks are sliced from plain ndarray views of the maps, which skips
+    # np.memmap's bookkeeping on every slice
+    views = {name: np.asarray(column) for name, column in columns.items()}
+    errors_view = np.asarray(errors)
+
+    # range() still yields one (empty) block for no rows, which fixes the dtype
+    for start in range(0, max(n_rows, 1), block_rows):
+        stop = min(start + block_rows, n_rows)
+        block = {name: view[start:stop] if view.ndim else view for name, view in views.items()}
+        try:
+            result = evaluator.evaluate(block, stop - start, errors_view[start:stop])
+        except LiteralOverflow as e:
+            return None, literal_too_large(source, node, e)
+
+        # The output's dtype is only known once the first block is done. A
+        # formula that is just an int literal past int64 would need objects,
+        # which cannot be mapped
+        if values is None:
+            dtype = np.result_type(result)
+            if dtype == object: return None, literal_too_large(source, node, LiteralOverflow(result, np.dtype(np.int64)))
+            values = np.lib.format.open_memmap(out_path, mode='w+', dtype=dtype, shape=rows)
+            values_view = np.asarray(values)
+        values_view[start:stop] = result
+
+        inexact = np.flatnonzero(evaluator.inexact)
+        if len(inexact):
+            bytecode = bytecode or legacy.BytecodeCompiler().compile(node)
+            block = {name: np.broadcast_to(column, (stop - start,)) for name, column in block.items()}
+            for idx in inexact:
+                result = run_row(bytecode, source, block, idx)
+                errors_view[start + idx] = True
+                if result.error: continue
+                try:
+                    values_view[start + idx] = result.value.value
+                    errors_view[start + idx] = False
+                except OverflowError:
+                    pass  # error(idx) says what does not fit
+
+    values.flush()
+    errors.flush()
+    columns = {name: np.broadcast_to(column, rows) for name, column in columns.items()}
+
+    return VectorResult(source, node, columns, values, errors), None